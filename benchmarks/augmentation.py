@@ -0,0 +1,95 @@
+import argparse, sys, time, torch
+import numpy as np
+from src.batchaugment import BatchAugmentation
+from src.dataloader import build_train_transform
+from src.imagecache import load_resized
+from src.manifest import ManifestImageFolder
+
+def load_images(count, image_size):
+    samples = ManifestImageFolder('train').samples[:count]
+    return np.stack([load_resized(path, image_size) for path, _ in samples])
+
+def image_statistics(imgs):
+    gradients = (imgs[:, :, :, 1:] - imgs[:, :, :, :-1]).abs().mean(dim=(1, 2, 3))
+    return {
+        'mean': imgs.mean(dim=(1, 2, 3)),
+        'std': imgs.std(dim=(1, 2, 3)),
+        'red_mean': imgs[:, 0].mean(dim=(1, 2)),
+        'blue_mean': imgs[:, 2].mean(dim=(1, 2)),
+        'gradient': gradients
+    }
+
+def ks_statistic(a, b):
+    a, b = np.sort(a), np.sort(b)
+    values = np.concatenate([a, b])
+    return np.abs(np.searchsorted(a, values, side='right') / len(a) - np.searchsorted(b, values, side='right') / len(b)).max()
+
+def albumentations_outputs(images, repeats, image_size):
+    transform = build_train_transform(image_size)
+    return torch.stack([transform(image=image)['image'] for _ in range(repeats) for image in images])
+
+def batch_outputs(images, repeats, device):
+    augmentation = BatchAugmentation()
+    batch = torch.from_numpy(images).permute(0, 3, 1, 2).to(device)
+    return torch.cat([augmentation(batch).cpu() for _ in range(repeats)])
+
+def compare(images, repeats, image_size, device, alpha_coefficient=1.628):
+    reference = image_statistics(albumentations_outputs(images, repeats, image_size))
+    candidate = image_statistics(batch_outputs(images, repeats, device))
+    n = len(images) * repeats
+    critical = alpha_coefficient * np.sqrt(2 / n)
+
+    passed = True
+    print(f'{"statistic":<12}{"albumentations":>16}{"batch":>12}{"KS D":>10}{"critical":>10}')
+    for name in reference:
+        a, b = reference[name].numpy(), candidate[name].numpy()
+        d = ks_statistic(a, b)
+        passed &= d <= critical
+        print(f'{name:<12}{a.mean():>16.4f}{b.mean():>12.4f}{d:>10.4f}{critical:>10.4f}')
+    return passed
+
+def throughput(images, batch_size, image_size, device, batches):
+    transform = build_train_transform(image_size)
+    count = min(len(images), batch_size)
+    start = time.perf_counter()
+    for _ in range(batches):
+        for image in images[:count]:
+            transform(image=image)
+    albumentations_rate = batches * count / (time.perf_counter() - start)
+
+    augmentation = BatchAugmentation()
+    batch = torch.from_numpy(images[:count]).permute(0, 3, 1, 2).contiguous()
+    augmentation(batch.to(device))
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    start = time.perf_counter()
+    for _ in range(batches):
+        augmentation(batch.to(device, non_blocking=True))
+    if device.type == 'cuda':
+        torch.cuda.synchronize()
+    batch_rate = batches * count / (time.perf_counter() - start)
+    return albumentations_rate, batch_rate
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Check that the batch augmentation backend matches the Albumentations pipeline statistically and compare their throughput.')
+    parser.add_argument('--images', type=int, default=256, help='Training images to augment')
+    parser.add_argument('--repeats', type=int, default=4, help='Augmented copies of every image')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--batches', type=int, default=10, help='Batches timed per backend')
+    parser.add_argument('--device', default=None)
+    args = parser.parse_args()
+
+    device = torch.device(args.device or ('cuda' if torch.cuda.is_available() else 'cpu'))
+    torch.manual_seed(42)
+    np.random.seed(42)
+    images = load_images(args.images, args.image_size)
+
+    passed = compare(images, args.repeats, args.image_size, device)
+    albumentations_rate, batch_rate = throughput(images, args.batch_size, args.image_size, device, args.batches)
+    print(f'\nalbumentations (one process): {albumentations_rate:.1f} images/s')
+    print(f'batch on {device}: {batch_rate:.1f} images/s ({batch_rate / albumentations_rate:.1f}x)')
+
+    if not passed:
+        print('\nThe batch backend output distribution differs from Albumentations (KS D above the critical value at alpha=0.01)')
+        sys.exit(1)
@@ -0,0 +1,67 @@
+import argparse, time, torch
+from src.model import get_model
+from src.compilation import compile_model, COMPILE_BACKENDS, COMPILE_MODES
+
+def time_calls(step, runs):
+    start = time.perf_counter()
+    for _ in range(runs):
+        step()
+    return (time.perf_counter() - start) / runs
+
+def inference_step(model, imgs):
+    def step():
+        with torch.no_grad():
+            model(imgs)
+    return step
+
+def training_step(model, imgs, labels, optimizer, criterion):
+    def step():
+        optimizer.zero_grad()
+        criterion(model(imgs), labels).backward()
+        optimizer.step()
+    return step
+
+def benchmark(model_name, backend, mode, batch_size, image_size, runs, train):
+    torch._dynamo.reset()
+    torch.manual_seed(42)
+    model = get_model(model_name=model_name, num_classes=6, pretrained=False)
+    model.train(train)
+    imgs = torch.randn(batch_size, 3, image_size, image_size)
+    labels = torch.randint(0, 6, (batch_size,))
+    criterion = torch.nn.CrossEntropyLoss()
+
+    def make_step(module):
+        if train:
+            return training_step(module, imgs, labels, torch.optim.SGD(model.parameters(), lr=1e-6), criterion)
+        return inference_step(module, imgs)
+
+    eager_step = make_step(model)
+    eager_step()
+    eager = time_calls(eager_step, runs)
+
+    compiled_step = make_step(compile_model(model, backend=backend, mode=mode))
+    start = time.perf_counter()
+    compiled_step()
+    warm_up = time.perf_counter() - start
+    compiled = time_calls(compiled_step, runs)
+    return eager, warm_up, compiled
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare eager and torch.compile steady-state step time and compilation warm-up cost on the CPU.')
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--backend', choices=COMPILE_BACKENDS, default='inductor')
+    parser.add_argument('--modes', nargs='+', choices=COMPILE_MODES, default=['default', 'max-autotune-no-cudagraphs'])
+    parser.add_argument('--batch-size', type=int, default=8)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--runs', type=int, default=10, help='Timed steps after warm-up')
+    args = parser.parse_args()
+
+    print(f'{"step":<12}{"mode":<30}{"eager ms":>10}{"compiled ms":>13}{"speedup":>9}{"warm-up s":>11}{"break-even":>12}')
+    for train in (False, True):
+        for mode in args.modes:
+            eager, warm_up, compiled = benchmark(args.model_name, args.backend, mode, args.batch_size, args.image_size, args.runs, train)
+            saved = eager - compiled
+            break_even = f'{warm_up / saved:.0f} steps' if saved > 0 else 'never'
+            step = 'training' if train else 'inference'
+            print(f'{step:<12}{mode:<30}{eager * 1000:>10.1f}{compiled * 1000:>13.1f}{eager / compiled:>8.2f}x{warm_up:>11.1f}{break_even:>12}')
+    print('\nWarm-up includes compilation. Run again to see the warm-up with the on-disk cache in .cache/torch_compile.')
@@ -0,0 +1,49 @@
+import argparse, importlib.util, sys, tempfile, time, torch
+from pathlib import Path
+from timm.layers import set_exportable
+from src.model import get_model
+from src.backends import load_torchscript_model, OnnxModel
+from src.export import EXPORT_FORMATS, export_torchscript, export_onnx, check_parity, single_image_latency
+
+def export_and_load(model, export_format, out_dir, image_size):
+    if export_format == 'torchscript':
+        return load_torchscript_model(export_torchscript(model, out_dir / 'model.pt', image_size))
+    return OnnxModel(export_onnx(model, out_dir / 'model.onnx', image_size))
+
+def check_model(model_name, formats, image_size, batch_sizes):
+    # Random weights are enough here: parity depends on the graph, not on what the model learned.
+    torch.manual_seed(0)
+    with set_exportable(True):
+        model = get_model(model_name=model_name, num_classes=6, pretrained=False).eval()
+    print(f'{model_name} torch: {single_image_latency(model, image_size) * 1000:.1f} ms/image')
+
+    passed = True
+    with tempfile.TemporaryDirectory() as out_dir:
+        for export_format in formats:
+            if export_format == 'onnx' and importlib.util.find_spec('onnxruntime') is None:
+                print(f'{model_name} onnx: skipped, onnxruntime is not installed')
+                continue
+            start = time.perf_counter()
+            runner = export_and_load(model, export_format, Path(out_dir), image_size)
+            export_seconds = time.perf_counter() - start
+            try:
+                max_error = check_parity(model, runner, image_size, batch_sizes)
+            except ValueError as e:
+                print(f'{model_name} {export_format}: FAILED, {e}')
+                passed = False
+                continue
+            print(f'{model_name} {export_format}: max abs difference {max_error:.2e}, exported in {export_seconds:.1f} s, {single_image_latency(runner, image_size) * 1000:.1f} ms/image')
+    return passed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export untrained models to TorchScript and ONNX and check that the exported models match eager PyTorch.')
+    parser.add_argument('--model-names', nargs='+', default=['densenet201', 'mobilenetv4_hybrid_medium.e500_r224_in1k'])
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS))
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    results = [check_model(model_name, args.formats, args.image_size, tuple(args.batch_sizes)) for model_name in args.model_names]
+    if not all(results):
+        print('\nAn exported model does not match eager PyTorch')
+        sys.exit(1)
@@ -0,0 +1,53 @@
+import argparse, time, torch
+import torch.optim as optim
+from itertools import islice
+from src.model import get_model
+from src.dataloader import get_dataloaders
+from src.precision import resolve_precision, make_grad_scaler, prepare_model
+from src.trainer import Trainer
+
+def benchmark(model_name, precision, channels_last, train_loader, validation_loader, epochs=2, max_batches=None):
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    precision = resolve_precision(precision, device)
+    torch.manual_seed(42)
+    model = prepare_model(get_model(model_name=model_name, num_classes=6, pretrained=True), device, channels_last)
+    criterion = torch.nn.CrossEntropyLoss()
+    optimizer = optim.AdamW(model.parameters(), lr=0.00001, weight_decay=0.0001)
+    scaler = make_grad_scaler(device, precision)
+
+    trainer = Trainer(model, criterion, device, precision=precision, channels_last=channels_last)
+
+    epoch_times = []
+    for epoch in range(epochs):
+        start = time.perf_counter()
+        trainer.train_epoch(islice(train_loader, max_batches), optimizer, scaler)
+        epoch_times.append(time.perf_counter() - start)
+
+    _, accuracy = trainer.validate(islice(validation_loader, max_batches))
+
+    return precision, epoch_times, accuracy
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Compare per-epoch time and validation accuracy of fp32 and mixed precision training.')
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--epochs', type=int, default=2)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--max-batches', type=int, default=None, help='Limit the number of batches per epoch')
+    parser.add_argument('--precisions', nargs='+', default=['fp32', 'bf16', 'fp16'])
+    args = parser.parse_args()
+
+    train_loader, validation_loader, _ = get_dataloaders(batch_size=args.batch_size)
+
+    results = []
+    for requested in args.precisions:
+        for channels_last in (False, True):
+            precision, epoch_times, accuracy = benchmark(args.model_name, requested, channels_last, train_loader, validation_loader, args.epochs, args.max_batches)
+            results.append((requested, precision, channels_last, epoch_times, accuracy))
+            print(f'{requested} (ran as {precision}), channels_last={channels_last}: {sum(epoch_times) / len(epoch_times):.2f}s/epoch, validation accuracy {accuracy:.2f}%')
+
+    baseline = results[0][3]
+    baseline_time = sum(baseline) / len(baseline)
+    print(f'\n{"precision":<10}{"channels_last":<15}{"s/epoch":>10}{"speedup":>10}{"val acc":>10}')
+    for requested, precision, channels_last, epoch_times, accuracy in results:
+        epoch_time = sum(epoch_times) / len(epoch_times)
+        print(f'{precision:<10}{str(channels_last):<15}{epoch_time:>10.2f}{baseline_time / epoch_time:>9.2f}x{accuracy:>9.2f}%')
@@ -0,0 +1,70 @@
+import argparse, os, socket, time, torch
+import torch.distributed as dist
+import torch.multiprocessing as mp
+from torch.nn.parallel import DistributedDataParallel
+from src.model import get_model
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+def run_rank(rank, world_size, port, model_name, batch_size, image_size, steps, warmup_steps, results):
+    os.environ['MASTER_ADDR'] = '127.0.0.1'
+    os.environ['MASTER_PORT'] = str(port)
+    dist.init_process_group('gloo', rank=rank, world_size=world_size)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // world_size))
+    torch.manual_seed(rank)
+
+    model = DistributedDataParallel(get_model(model_name=model_name, num_classes=6, pretrained=False))
+    optimizer = torch.optim.AdamW(model.parameters(), lr=0.00001)
+    criterion = torch.nn.CrossEntropyLoss()
+    imgs = torch.randn(batch_size, 3, image_size, image_size)
+    labels = torch.randint(0, 6, (batch_size,))
+
+    def step():
+        optimizer.zero_grad()
+        criterion(model(imgs), labels).backward()
+        optimizer.step()
+
+    for _ in range(warmup_steps):
+        step()
+    dist.barrier()
+    start = time.perf_counter()
+    for _ in range(steps):
+        step()
+    dist.barrier()
+    elapsed = time.perf_counter() - start
+
+    if rank == 0:
+        results.put(world_size * batch_size * steps / elapsed)
+    dist.destroy_process_group()
+
+def benchmark(world_size, model_name, batch_size, image_size, steps, warmup_steps):
+    context = mp.get_context('spawn')
+    results = context.SimpleQueue()
+    mp.start_processes(
+        run_rank,
+        args=(world_size, free_port(), model_name, batch_size, image_size, steps, warmup_steps, results),
+        nprocs=world_size,
+        start_method='spawn'
+    )
+    return results.get()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Measure DistributedDataParallel (gloo) training throughput on this machine for different numbers of processes.')
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--processes', type=int, nargs='+', default=[1, 2, 4, 8])
+    parser.add_argument('--batch-size', type=int, default=16, help='Batch size per process')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--steps', type=int, default=10)
+    parser.add_argument('--warmup-steps', type=int, default=2)
+    args = parser.parse_args()
+
+    print(f'{"processes":<11}{"images/s":>10}{"speedup":>10}{"efficiency":>12}')
+    baseline = None
+    for world_size in args.processes:
+        throughput = benchmark(world_size, args.model_name, args.batch_size, args.image_size, args.steps, args.warmup_steps)
+        baseline = baseline or throughput / world_size
+        speedup = throughput / baseline
+        print(f'{world_size:<11}{throughput:>10.1f}{speedup:>9.2f}x{speedup / world_size:>11.0%}')
@@ -0,0 +1,46 @@
+import argparse, subprocess, sys
+from configs.paths import BASE_DIR
+
+FORBIDDEN_MODULES = ['albumentations', 'sklearn', 'matplotlib', 'optuna', 'cv2', 'tensorboard', 'src.dataloader', 'src.evaluate']
+
+def measure_imports(module='src.app'):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], cwd=BASE_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'Importing {module} failed:\n{result.stderr}')
+
+    imports = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        imports[name.strip()] = (int(self_us), int(cumulative_us))
+    return imports
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure and guard the import time of the app entry point.')
+    parser.add_argument('--module', default='src.app')
+    parser.add_argument('--budget', type=float, default=None, help='Maximum cumulative import time in seconds')
+    parser.add_argument('--top', type=int, default=15)
+    args = parser.parse_args()
+
+    imports = measure_imports(args.module)
+    total = imports[args.module][1] / 1e6
+
+    print(f'Cumulative import time of {args.module}: {total:.3f}s')
+    print(f'Slowest {args.top} imports (self time):')
+    for name, (self_us, cumulative_us) in sorted(imports.items(), key=lambda item: item[1][0], reverse=True)[:args.top]:
+        print(f'  {self_us / 1000:9.1f}ms  {cumulative_us / 1000:9.1f}ms  {name}')
+
+    failures = []
+    leaked = [name for name in imports if any(name == forbidden or name.startswith(forbidden + '.') for forbidden in FORBIDDEN_MODULES)]
+    if leaked:
+        failures.append(f'Training/evaluation modules imported at startup: {", ".join(sorted(leaked))}')
+    if args.budget is not None and total > args.budget:
+        failures.append(f'Import time {total:.3f}s exceeds budget of {args.budget:.3f}s')
+
+    for failure in failures:
+        print(f'FAIL: {failure}')
+    sys.exit(1 if failures else 0)
+
+if __name__ == '__main__':
+    main()
@@ -3,10 +3,16 @@ from pathlib import Path
 BASE_DIR = Path(__file__).resolve().parent.parent
 MODELS_DIR = BASE_DIR / 'models'
 LOGS_DIR = BASE_DIR / 'logs'
+TRAINING_STATE_PATH = MODELS_DIR / 'training_state.pth'
+EVALUATION_REPORT_PATH = LOGS_DIR / 'evaluation_report.json'
 
 
 DATA_DIR = BASE_DIR / 'data'
 RAW_DATA_DIR = DATA_DIR / 'raw' / 'dataset-original'
 TEST_DATA_DIR = DATA_DIR / 'test'
 TRAIN_DATA_DIR = DATA_DIR / 'train'
-VAL_DATA_DIR = DATA_DIR / 'validation'
\ No newline at end of file
+VAL_DATA_DIR = DATA_DIR / 'validation'
+FEATURES_DIR = DATA_DIR / 'features'
+IMAGE_CACHE_DIR = DATA_DIR / 'cache'
+MANIFEST_PATH = DATA_DIR / 'manifest.json'
+CACHE_DIR = BASE_DIR / '.cache'
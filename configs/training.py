@@ -0,0 +1,12 @@
+PRECISION = 'fp32'
+CHANNELS_LAST = False
+STAGE1_FEATURE_CACHE = False
+STAGE1_AUGMENTATIONS = 1
+IMAGE_CACHE = False
+IMAGE_CACHE_SIZE = None
+AUGMENTATION_BACKEND = 'albumentations'
+COMPILE = False
+COMPILE_BACKEND = 'inductor'
+COMPILE_MODE = 'default'
+EFFECTIVE_BATCH_SIZE = 64
+AUTO_BATCH_SIZE = False
@@ -1,17 +1,39 @@
 import sys, os
-from src.evaluate import predict_image
-from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QSizePolicy, QPushButton, QGridLayout, QMenuBar, QSpacerItem, QFileDialog, QMessageBox, QDialog, QMenu
-from PyQt6.QtCore import Qt, QSize, QSettings, pyqtSignal
-from PyQt6.QtGui import QPixmap, QColor, QPainter, QBrush, QAction
+from src.predictor import IMAGE_EXTENSIONS, get_predictor
+from src.predict_batch import collect_image_paths
+from configs.paths import MODELS_DIR
+from PyQt6.QtWidgets import QApplication, QMainWindow, QWidget, QLabel, QVBoxLayout, QHBoxLayout, QSizePolicy, QPushButton, QGridLayout, QMenuBar, QSpacerItem, QFileDialog, QMessageBox, QDialog, QMenu, QListWidget, QListWidgetItem, QListView
+from PyQt6.QtCore import Qt, QSize, QSettings, QObject, QThread, pyqtSignal, pyqtSlot
+from PyQt6.QtGui import QPixmap, QColor, QPainter, QBrush, QAction, QActionGroup, QIcon, QImage, QImageReader
+
+MODEL_FILES = [
+    ("PyTorch (fp32)", "stage2_best.pth"),
+    ("TorchScript", "stage2_best.pt"),
+    ("ONNX Runtime (CPU)", "stage2_best.onnx"),
+    ("Quantized int8 (CPU)", "stage2_best.int8.pt")
+]
 
 class WasteClassifierApp(QMainWindow):
+    requestClassification = pyqtSignal(int, list)
+    requestModel = pyqtSignal(str, bool)
+    requestThumbnails = pyqtSignal(int, list)
+
     def __init__(self):
         super().__init__()
         self.setWindowTitle("Waste Classifier")
         self.resize(900, 1000)
         self.image_path = None
+        self.queueItems = {}
+        self.results = {}
+        self.pending = set()
+        self.requestId = 0
+        self.thumbnailRequestId = 0
         self.settings = QSettings("Stenberg-N", "WasteClassifierApp")
         self.currentTheme = self.settings.value("theme", "light")
+        self.checkpointPath = self.settings.value("model", str(MODELS_DIR / "stage2_best.pth"))
+        if not os.path.exists(self.checkpointPath):
+            self.checkpointPath = str(MODELS_DIR / "stage2_best.pth")
+        self.compileModel = self.settings.value("compile", False, type=bool)
 
         self.layout = QVBoxLayout()
         self.layout.setContentsMargins(0, 0, 0, 0)
@@ -32,11 +54,16 @@ class WasteClassifierApp(QMainWindow):
         self.fileMenu = CustomMenu("File")
         self.fileMenuBar.addMenu(self.fileMenu)
 
+        self.modelMenuBar = CustomMenuBar()
+        self.modelMenu = CustomMenu("Model")
+        self.modelMenuBar.addMenu(self.modelMenu)
+
         self.helpMenuBar = CustomMenuBar()
         self.helpMenu = CustomMenu("Help")
         self.helpMenuBar.addMenu(self.helpMenu)
 
         self.containerBarMenuOptionsLayout.addWidget(self.fileMenuBar)
+        self.containerBarMenuOptionsLayout.addWidget(self.modelMenuBar)
         self.containerBarMenuOptionsLayout.addWidget(self.helpMenuBar)
         self.barMenu.setCornerWidget(self.containerBarMenuOptions, Qt.Corner.TopLeftCorner)
 
@@ -47,15 +74,17 @@ class WasteClassifierApp(QMainWindow):
         self.buttonToggleTheme.clicked.connect(self.toggleTheme)
         self.barMenu.setCornerWidget(self.buttonToggleTheme, Qt.Corner.TopRightCorner)
 
-        self.actionUpload = QAction("Upload image")
-        self.actionClear = QAction("Clear image")
-        self.actionClassify = QAction("Classify image")
+        self.actionUpload = QAction("Upload images")
+        self.actionUploadFolder = QAction("Upload folder")
+        self.actionClear = QAction("Clear images")
+        self.actionClassify = QAction("Classify images")
         self.actionClassify.setEnabled(False)
         self.actionExit = QAction("Exit")
         self.actionImageUploading = QAction("Image upload")
         self.actionWasteInfo = QAction("Waste info")
 
         self.actionUpload.triggered.connect(self.uploadImage)
+        self.actionUploadFolder.triggered.connect(self.uploadFolder)
         self.actionClear.triggered.connect(self.clearImage)
         self.actionClassify.triggered.connect(self.classifyImage)
         self.actionExit.triggered.connect(self.close)
@@ -63,11 +92,33 @@ class WasteClassifierApp(QMainWindow):
         self.actionWasteInfo.triggered.connect(self.dialogWasteInfo)
 
         self.fileMenu.addAction(self.actionUpload)
+        self.fileMenu.addAction(self.actionUploadFolder)
         self.fileMenu.addAction(self.actionClear)
         self.fileMenu.addAction(self.actionClassify)
         self.fileMenu.addSeparator()
         self.fileMenu.addAction(self.actionExit)
 
+        self.modelActions = QActionGroup(self)
+        self.modelActions.setExclusive(True)
+        for name, filename in MODEL_FILES:
+            action = QAction(name, self)
+            action.setCheckable(True)
+            action.setData(str(MODELS_DIR / filename))
+            self.modelActions.addAction(action)
+            self.modelMenu.addAction(action)
+        self.actionOtherModel = QAction("Other model file...")
+        self.actionCompile = QAction("Compiled mode (PyTorch)")
+        self.actionCompile.setCheckable(True)
+        self.actionCompile.setChecked(self.compileModel)
+        self.modelMenu.addSeparator()
+        self.modelMenu.addAction(self.actionOtherModel)
+        self.modelMenu.addAction(self.actionCompile)
+
+        self.modelActions.triggered.connect(self.selectModel)
+        self.actionOtherModel.triggered.connect(self.chooseModelFile)
+        self.actionCompile.toggled.connect(self.toggleCompile)
+        self.modelMenu.aboutToShow.connect(self.updateModelMenu)
+
         self.helpMenu.addAction(self.actionImageUploading)
         self.helpMenu.addAction(self.actionWasteInfo)
 
@@ -97,7 +148,7 @@ class WasteClassifierApp(QMainWindow):
         self.labelImage = SquareLabel("""
             <p style='text-align: center;'>
                 No image uploaded<br>
-                <br>Drag and drop an image here,
+                <br>Drag and drop images or folders here,
                 <br>or click me to open the file explorer
             </p>
         """)
@@ -112,6 +163,18 @@ class WasteClassifierApp(QMainWindow):
         self.labelImage.setAcceptDrops(True)
         self.labelImage.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
 
+        self.listQueue = QListWidget()
+        self.containerImageButtonsLayout.addWidget(self.listQueue)
+        self.listQueue.setViewMode(QListView.ViewMode.IconMode)
+        self.listQueue.setFlow(QListView.Flow.LeftToRight)
+        self.listQueue.setWrapping(False)
+        self.listQueue.setMovement(QListView.Movement.Static)
+        self.listQueue.setIconSize(QSize(96, 96))
+        self.listQueue.setGridSize(QSize(140, 140))
+        self.listQueue.setFixedHeight(160)
+        self.listQueue.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Fixed)
+        self.listQueue.currentItemChanged.connect(self.selectQueueItem)
+
         self.containerFileResultsLayout = QVBoxLayout()
         self.containerFileResultsLayout.setContentsMargins(10, 10, 10, 10)
         self.containerFileResults = QWidget()
@@ -132,10 +195,14 @@ class WasteClassifierApp(QMainWindow):
         self.containerFileResultsLayout.addWidget(self.labelFile)
         self.labelFile.setMaximumHeight(40)
 
+        self.labelQueue = QLabel("Queue: 0 images")
+        self.containerFileResultsLayout.addWidget(self.labelQueue)
+        self.labelQueue.setMaximumHeight(40)
+
         self.spacer = QSpacerItem(1, 1, QSizePolicy.Policy.Minimum, QSizePolicy.Policy.Expanding)
         self.containerImageButtonsLayout.addItem(self.spacer)
 
-        self.buttonUpload = HoverButton("Upload Image")
+        self.buttonUpload = HoverButton("Upload Images")
         self.buttonClassify = HoverButton("Classify")
         self.buttonClear = HoverButton("Clear")
         self.buttonUpload.setSizePolicy(QSizePolicy.Policy.Expanding, QSizePolicy.Policy.Expanding)
@@ -415,6 +482,34 @@ class WasteClassifierApp(QMainWindow):
 
         self.applyTheme(self.currentTheme)
 
+        self.inferenceThread = QThread()
+        self.inferenceWorker = InferenceWorker(get_predictor(checkpoint_path=self.checkpointPath, compile=self.compileModel))
+        self.inferenceWorker.moveToThread(self.inferenceThread)
+        self.inferenceThread.started.connect(self.inferenceWorker.warmUp)
+        self.requestClassification.connect(self.inferenceWorker.classify)
+        self.requestModel.connect(self.inferenceWorker.loadModel)
+        self.inferenceWorker.resultReady.connect(self.showResult)
+        self.inferenceWorker.failed.connect(self.showError)
+        self.inferenceWorker.warmUpFailed.connect(self.showWarmUpError)
+        self.inferenceThread.start()
+
+        self.placeholderIcon = self.makePlaceholderIcon()
+        self.thumbnailThread = QThread()
+        self.thumbnailWorker = ThumbnailWorker()
+        self.thumbnailWorker.moveToThread(self.thumbnailThread)
+        self.requestThumbnails.connect(self.thumbnailWorker.load)
+        self.thumbnailWorker.thumbnailReady.connect(self.showThumbnail)
+        self.thumbnailThread.start()
+
+    def closeEvent(self, event):
+        self.cancelPendingRequests()
+        self.cancelThumbnails()
+        self.inferenceThread.quit()
+        self.thumbnailThread.quit()
+        self.inferenceThread.wait()
+        self.thumbnailThread.wait()
+        super().closeEvent(event)
+
     def makeRoundedPixmap(self, pixmap, radius=10):
         scaled = pixmap.scaled(500, 500, Qt.AspectRatioMode.KeepAspectRatio, Qt.TransformationMode.SmoothTransformation)
         rounded = QPixmap(scaled.size())
@@ -432,56 +527,218 @@ class WasteClassifierApp(QMainWindow):
             event.acceptProposedAction()
 
     def dropEvent(self, event):
-        url = event.mimeData().urls()[0]
-        image_path = url.toLocalFile()
-        if image_path.lower().endswith(('.png', '.jpg')):
-            pixmap = QPixmap(url.toLocalFile())
-            rounded_pixmap = self.makeRoundedPixmap(pixmap)
-            self.labelImage.setPixmap(rounded_pixmap)
-            self.labelFile.setText(f"Uploaded image: {url.fileName()}")
-            self.image_path = image_path
+        image_paths = self.collectImagePaths(url.toLocalFile() for url in event.mimeData().urls())
+        if image_paths:
+            self.addImages(image_paths)
         else:
-            msg = QMessageBox(QMessageBox.Icon.Warning, "Invalid File", "Please drop an image file (.png, .jpg)", parent=self)
+            msg = QMessageBox(QMessageBox.Icon.Warning, "Invalid File", "Please drop image files (.png, .jpg) or folders containing them", parent=self)
             msg.exec()
 
     def uploadImage(self):
-        filename, _ = QFileDialog.getOpenFileName(
-            self, "Open Image", "", "Image Files (*.png *.jpg)"
+        filenames, _ = QFileDialog.getOpenFileNames(
+            self, "Open Images", "", "Image Files (*.png *.jpg *.jpeg)"
         )
-        if filename:
-            self.image_path = filename
-            self.labelFile.setText(f"Uploaded Image: {os.path.basename(filename)}")
-            pixmap = QPixmap(filename)
-            rounded_pixmap = self.makeRoundedPixmap(pixmap)
-            self.labelImage.setPixmap(rounded_pixmap)
-            self.checkImageUpload()
+        if filenames:
+            self.addImages(filenames)
+
+    def uploadFolder(self):
+        folder = QFileDialog.getExistingDirectory(self, "Open Folder")
+        if folder:
+            image_paths = self.collectImagePaths([folder])
+            if image_paths:
+                self.addImages(image_paths)
+            else:
+                msg = QMessageBox(QMessageBox.Icon.Warning, "No Images", "The folder does not contain any image files (.png, .jpg)", parent=self)
+                msg.exec()
+
+    def collectImagePaths(self, paths):
+        image_paths = []
+        for path in paths:
+            if os.path.isdir(path):
+                image_paths.extend(str(image_path) for image_path in collect_image_paths([path]))
+            elif path.lower().endswith(IMAGE_EXTENSIONS):
+                image_paths.append(path)
+        return image_paths
+
+    def makePlaceholderIcon(self, size=96):
+        pixmap = QPixmap(size, size)
+        pixmap.fill(QColor(128, 128, 128, 60))
+        return QIcon(pixmap)
+
+    def addImages(self, image_paths):
+        new_paths = []
+        for image_path in image_paths:
+            if image_path in self.queueItems:
+                continue
+            item = QListWidgetItem(self.placeholderIcon, os.path.basename(image_path))
+            item.setData(Qt.ItemDataRole.UserRole, image_path)
+            item.setToolTip(image_path)
+            self.listQueue.addItem(item)
+            self.queueItems[image_path] = item
+            new_paths.append(image_path)
+
+        self.listQueue.setCurrentItem(self.queueItems[image_paths[-1]])
+        self.updateQueueLabel()
+        self.checkImageUpload()
+        if new_paths:
+            self.requestThumbnails.emit(self.thumbnailRequestId, new_paths)
+
+    def showThumbnail(self, requestId, image_path, image):
+        if requestId != self.thumbnailRequestId:
+            return
+        item = self.queueItems.get(image_path)
+        if item is not None and not image.isNull():
+            item.setIcon(QIcon(QPixmap.fromImage(image)))
+
+    def cancelThumbnails(self):
+        self.thumbnailRequestId += 1
+        self.thumbnailWorker.latestRequest = self.thumbnailRequestId
+
+    def selectQueueItem(self, current, previous):
+        if current is None:
+            return
+        self.image_path = current.data(Qt.ItemDataRole.UserRole)
+        pixmap = QPixmap(self.image_path)
+        rounded_pixmap = self.makeRoundedPixmap(pixmap)
+        self.labelImage.setPixmap(rounded_pixmap)
+        self.labelFile.setText(f"Uploaded image: {os.path.basename(self.image_path)}")
+        self.showSelectedResult()
+
+    def showSelectedResult(self):
+        if self.image_path in self.results:
+            predicted_class, confidence = self.results[self.image_path]
+            self.labelResults.setText(f"Prediction: {predicted_class}")
+            self.labelConfidence.setText(f"Confidence: {confidence * 100:.2f}% sure")
+        elif self.image_path in self.pending:
+            self.labelResults.setText("Prediction: classifying...")
+            self.labelConfidence.setText("Confidence: ")
+        else:
+            self.resetResults()
+
+    def updateQueueLabel(self):
+        text = f"Queue: {len(self.queueItems)} images, {len(self.results)} classified"
+        if self.pending:
+            text += f", {len(self.pending)} in progress"
+        self.labelQueue.setText(text)
 
     def classifyImage(self):
-        if not self.image_path:
+        if not self.queueItems:
             msg = QMessageBox(QMessageBox.Icon.Critical, "Error", "Please upload an image!", parent=self)
             msg.exec()
             return
 
-        predicted_class, confidence = predict_image(self.image_path)
-        self.labelResults.setText(f"Prediction: {predicted_class}")
-        self.labelConfidence.setText(f"Confidence: {confidence * 100:.2f}% sure")
+        image_paths = [image_path for image_path in self.queueItems if image_path not in self.results]
+        if not image_paths:
+            return
+
+        self.cancelPendingRequests()
+        self.pending = set(image_paths)
+        self.showSelectedResult()
+        self.updateQueueLabel()
+        self.requestClassification.emit(self.requestId, image_paths)
+
+    def updateModelMenu(self):
+        for action in self.modelActions.actions():
+            action.setEnabled(os.path.exists(action.data()))
+            action.setChecked(os.path.abspath(action.data()) == os.path.abspath(self.checkpointPath))
+
+    def selectModel(self, action):
+        self.setModel(action.data())
+
+    def chooseModelFile(self):
+        filename, _ = QFileDialog.getOpenFileName(
+            self, "Open Model", str(MODELS_DIR), "Models (*.pth *.safetensors *.pt *.onnx)"
+        )
+        if filename:
+            self.setModel(filename)
+
+    def toggleCompile(self, checked):
+        self.compileModel = checked
+        self.settings.setValue("compile", checked)
+        self.reloadModel()
+
+    def setModel(self, checkpointPath):
+        if os.path.abspath(checkpointPath) == os.path.abspath(self.checkpointPath):
+            return
+        self.checkpointPath = checkpointPath
+        self.settings.setValue("model", checkpointPath)
+        self.reloadModel()
+
+    def reloadModel(self):
+        self.cancelPendingRequests()
+        self.results = {}
+        for image_path, item in self.queueItems.items():
+            item.setText(os.path.basename(image_path))
+            item.setToolTip(image_path)
+        self.showSelectedResult()
+        self.updateQueueLabel()
+        self.requestModel.emit(self.checkpointPath, self.compileModel)
+
+    def cancelPendingRequests(self):
+        self.requestId += 1
+        self.inferenceWorker.latestRequest = self.requestId
+        self.pending = set()
+
+    def resetResults(self):
+        self.labelResults.setText("Prediction: ")
+        self.labelConfidence.setText("Confidence: ")
+
+    def showResult(self, requestId, image_path, predicted_class, confidence):
+        if requestId != self.requestId:
+            return
+        self.pending.discard(image_path)
+        self.results[image_path] = (predicted_class, confidence)
+        item = self.queueItems.get(image_path)
+        if item is not None:
+            item.setText(f"{os.path.basename(image_path)}\n{predicted_class} ({confidence * 100:.0f}%)")
+        if image_path == self.image_path:
+            self.showSelectedResult()
+        self.updateQueueLabel()
+
+    def showError(self, requestId, image_path, message):
+        if requestId != self.requestId:
+            return
+        if not image_path:
+            self.cancelPendingRequests()
+            self.showSelectedResult()
+            self.updateQueueLabel()
+            msg = QMessageBox(QMessageBox.Icon.Critical, "Error", f"Classification failed: {message}", parent=self)
+            msg.exec()
+            return
+        self.pending.discard(image_path)
+        item = self.queueItems.get(image_path)
+        if item is not None:
+            item.setText(f"{os.path.basename(image_path)}\nfailed")
+            item.setToolTip(f"{image_path}\n{message}")
+        if image_path == self.image_path:
+            self.showSelectedResult()
+        self.updateQueueLabel()
+
+    def showWarmUpError(self, message):
+        msg = QMessageBox(QMessageBox.Icon.Critical, "Error", f"The model could not be loaded: {message}", parent=self)
+        msg.exec()
 
     def clearImage(self):
+        self.cancelPendingRequests()
+        self.cancelThumbnails()
         self.image_path = None
+        self.queueItems = {}
+        self.results = {}
+        self.listQueue.clear()
         self.labelImage.clear()
         self.labelImage.setText("""
             <p style='text-align: center;'>
                 No image uploaded<br>
-                <br>Drag and drop an image here
+                <br>Drag and drop images or folders here
             </p>
         """)
-        self.labelResults.setText("Prediction: ")
-        self.labelConfidence.setText("Confidence: ")
+        self.resetResults()
         self.labelFile.setText("Uploaded image: ")
+        self.updateQueueLabel()
         self.checkImageUpload()
 
     def checkImageUpload(self):
-        if self.image_path is not None:
+        if self.queueItems:
             self.actionClassify.setEnabled(True)
         else:
             self.actionClassify.setEnabled(False)
@@ -543,6 +800,7 @@ class WasteClassifierApp(QMainWindow):
             self.labelResults.setStyleSheet(self.darkLabelResults)
             self.labelConfidence.setStyleSheet(self.darkLabelConfidence)
             self.labelFile.setStyleSheet(self.darkLabelFile)
+            self.labelQueue.setStyleSheet(self.darkLabelFile)
             self.buttonUpload.setStyleSheet(self.darkButtonUpload)
             self.buttonClear.setStyleSheet(self.darkButtonClear)
             self.buttonClassify.setStyleSheet(self.darkButtonClassify)
@@ -556,6 +814,7 @@ class WasteClassifierApp(QMainWindow):
             self.labelResults.setStyleSheet(self.lightLabelResults)
             self.labelConfidence.setStyleSheet(self.lightLabelConfidence)
             self.labelFile.setStyleSheet(self.lightLabelFile)
+            self.labelQueue.setStyleSheet(self.lightLabelFile)
             self.buttonUpload.setStyleSheet(self.lightButtonUpload)
             self.buttonClear.setStyleSheet(self.lightButtonClear)
             self.buttonClassify.setStyleSheet(self.lightButtonClassify)
@@ -740,6 +999,63 @@ class WasteClassifierApp(QMainWindow):
             </p>
         """)
 
+class InferenceWorker(QObject):
+    resultReady = pyqtSignal(int, str, str, float)
+    failed = pyqtSignal(int, str, str)
+    warmUpFailed = pyqtSignal(str)
+
+    def __init__(self, predictor, batchSize=16):
+        super().__init__()
+        self.predictor = predictor
+        self.batchSize = batchSize
+        self.latestRequest = 0
+
+    @pyqtSlot()
+    def warmUp(self):
+        try:
+            self.predictor.warm_up()
+        except Exception as e:
+            self.warmUpFailed.emit(str(e))
+
+    @pyqtSlot(str, bool)
+    def loadModel(self, checkpointPath, compileModel):
+        self.predictor = get_predictor(checkpoint_path=checkpointPath, compile=compileModel)
+        self.warmUp()
+
+    @pyqtSlot(int, list)
+    def classify(self, requestId, imagePaths):
+        if requestId != self.latestRequest:
+            return
+        try:
+            for prediction in self.predictor.predict_paths(imagePaths, batch_size=self.batchSize):
+                if requestId != self.latestRequest:
+                    return
+                if prediction.error is not None:
+                    self.failed.emit(requestId, str(prediction.path), prediction.error)
+                else:
+                    self.resultReady.emit(requestId, str(prediction.path), prediction.predicted_class, prediction.confidence)
+        except Exception as e:
+            self.failed.emit(requestId, "", str(e))
+
+class ThumbnailWorker(QObject):
+    thumbnailReady = pyqtSignal(int, str, QImage)
+
+    def __init__(self, size=96):
+        super().__init__()
+        self.size = size
+        self.latestRequest = 0
+
+    @pyqtSlot(int, list)
+    def load(self, requestId, imagePaths):
+        for imagePath in imagePaths:
+            if requestId != self.latestRequest:
+                return
+            reader = QImageReader(imagePath)
+            reader.setAutoTransform(True)
+            if reader.size().isValid():
+                reader.setScaledSize(reader.size().scaled(self.size, self.size, Qt.AspectRatioMode.KeepAspectRatio))
+            self.thumbnailReady.emit(requestId, imagePath, reader.read())
+
 class SquareLabel(QLabel):
     def __init__(self, text=""):
         super().__init__(text)
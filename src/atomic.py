@@ -0,0 +1,45 @@
+import os, shutil, tempfile, threading
+from contextlib import contextmanager
+from pathlib import Path
+
+@contextmanager
+def atomic_path(path):
+    # A unique temporary name next to the target, so concurrent writers (threads or processes) never share one.
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp_name = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.stem}.', suffix=f'.tmp{path.suffix}')
+    os.close(fd)
+    tmp_path = Path(tmp_name)
+    try:
+        yield tmp_path
+        os.replace(tmp_path, path)
+    finally:
+        tmp_path.unlink(missing_ok=True)
+
+@contextmanager
+def atomic_write(path, mode='w'):
+    with atomic_path(path) as tmp_path, open(tmp_path, mode) as f:
+        yield f
+
+key_locks = {}
+key_locks_lock = threading.Lock()
+
+def key_lock(key):
+    with key_locks_lock:
+        return key_locks.setdefault(str(key), threading.Lock())
+
+@contextmanager
+def atomic_directory(path):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_dir = Path(tempfile.mkdtemp(dir=path.parent, prefix=f'.{path.name}.', suffix='.tmp'))
+    try:
+        yield tmp_dir
+        try:
+            os.replace(tmp_dir, path)
+        except OSError:
+            # Another process published the same directory first, keep its copy.
+            if not path.exists():
+                raise
+    finally:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
@@ -0,0 +1,52 @@
+import torch
+from pathlib import Path
+
+BACKENDS = ('torch', 'torchscript', 'onnx', 'int8')
+CPU_BACKENDS = ('onnx', 'int8')
+
+def infer_backend(checkpoint_path):
+    path = Path(checkpoint_path)
+    if path.name.endswith('.int8.pt'):
+        return 'int8'
+    if path.suffix == '.onnx':
+        return 'onnx'
+    if path.suffix == '.pt':
+        return 'torchscript'
+    return 'torch'
+
+class OnnxModel:
+    def __init__(self, onnx_path, device='cpu'):
+        import onnxruntime
+
+        providers = ['CPUExecutionProvider']
+        if torch.device(device).type == 'cuda' and 'CUDAExecutionProvider' in onnxruntime.get_available_providers():
+            providers.insert(0, 'CUDAExecutionProvider')
+        options = onnxruntime.SessionOptions()
+        options.graph_optimization_level = onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL
+        self.session = onnxruntime.InferenceSession(str(onnx_path), sess_options=options, providers=providers)
+        self.input_name = self.session.get_inputs()[0].name
+
+    def __call__(self, imgs):
+        outputs = self.session.run(None, {self.input_name: imgs.detach().cpu().float().contiguous().numpy()})[0]
+        return torch.from_numpy(outputs)
+
+    def eval(self):
+        return self
+
+def load_torchscript_model(checkpoint_path, device='cpu'):
+    model = torch.jit.load(str(checkpoint_path), map_location=device)
+    model.eval()
+    return model
+
+def load_backend_model(checkpoint_path, model_name='densenet201', num_classes=6, device='cpu', backend=None):
+    backend = backend or infer_backend(checkpoint_path)
+    if backend == 'onnx':
+        return OnnxModel(checkpoint_path, device=device)
+    if backend == 'torchscript':
+        return load_torchscript_model(checkpoint_path, device=device)
+    if backend == 'int8':
+        return load_torchscript_model(checkpoint_path, device='cpu')
+    if backend == 'torch':
+        from src.model import load_inference_model
+        return load_inference_model(checkpoint_path, model_name=model_name, num_classes=num_classes, device=device)
+    raise ValueError(f'Unknown backend {backend!r}, expected one of {BACKENDS}')
@@ -0,0 +1,145 @@
+import math, torch
+import torch.nn.functional as F
+
+AUGMENTATION_BACKENDS = ('albumentations', 'batch')
+MEAN = (0.485, 0.456, 0.406)
+STD = (0.229, 0.224, 0.225)
+
+def grayscale(imgs):
+    return (0.299 * imgs[:, 0:1] + 0.587 * imgs[:, 1:2] + 0.114 * imgs[:, 2:3])
+
+def rgb_to_hsv(imgs):
+    r, g, b = imgs.unbind(1)
+    maxc, minc = imgs.max(1).values, imgs.min(1).values
+    delta = maxc - minc
+    safe_delta = torch.where(delta > 0, delta, torch.ones_like(delta))
+    hue = torch.where(maxc == r, (g - b) / safe_delta, torch.where(maxc == g, 2 + (b - r) / safe_delta, 4 + (r - g) / safe_delta))
+    hue = torch.where(delta > 0, (hue / 6) % 1, torch.zeros_like(hue))
+    saturation = torch.where(maxc > 0, delta / torch.where(maxc > 0, maxc, torch.ones_like(maxc)), torch.zeros_like(maxc))
+    return torch.stack([hue, saturation, maxc], 1)
+
+def hsv_to_rgb(hsv):
+    hue, saturation, value = hsv[:, 0:1], hsv[:, 1:2], hsv[:, 2:3]
+    k = (torch.tensor([5, 3, 1], device=hsv.device, dtype=hsv.dtype).view(1, 3, 1, 1) + hue * 6) % 6
+    return value - value * saturation * torch.clamp(torch.minimum(k, 4 - k), 0, 1)
+
+def affine_matrices(angles, scales, shifts):
+    cos, sin = torch.cos(angles) * scales, torch.sin(angles) * scales
+    zeros, ones = torch.zeros_like(angles), torch.ones_like(angles)
+    return torch.stack([
+        torch.stack([cos, -sin, shifts[:, 0]], 1),
+        torch.stack([sin, cos, shifts[:, 1]], 1),
+        torch.stack([zeros, zeros, ones], 1)
+    ], 1)
+
+class BatchAugmentation:
+    def __init__(self, rotation_limit=30, shift_limit=0.1, scale_limit=0.15, brightness=0.2, contrast=0.2, saturation=0.2, hue=0.1):
+        self.update(rotation_limit=rotation_limit, shift_limit=shift_limit, scale_limit=scale_limit, brightness=brightness, contrast=contrast, saturation=saturation, hue=hue)
+
+    def update(self, rotation_limit, shift_limit, scale_limit, brightness, contrast, saturation, hue):
+        self.rotation_limit = rotation_limit
+        self.shift_limit = shift_limit
+        self.scale_limit = scale_limit
+        self.brightness = brightness
+        self.contrast = contrast
+        self.saturation = saturation
+        self.hue = hue
+
+    def __repr__(self):
+        return (f'BatchAugmentation(rotation_limit={self.rotation_limit}, shift_limit={self.shift_limit}, scale_limit={self.scale_limit}, '
+                f'brightness={self.brightness}, contrast={self.contrast}, saturation={self.saturation}, hue={self.hue})')
+
+    def uniform(self, low, high, size, device):
+        return low + (high - low) * torch.rand(size, device=device)
+
+    def chance(self, p, size, device):
+        return torch.rand(size, device=device) < p
+
+    def geometric(self, imgs):
+        batch, device = imgs.shape[0], imgs.device
+        ones, zeros = torch.ones(batch, device=device), torch.zeros(batch, 2, device=device)
+
+        quarter_turns = torch.randint(0, 4, (batch,), device=device) * self.chance(0.5, batch, device)
+        rot90 = affine_matrices(quarter_turns * (math.pi / 2), ones, zeros).round()
+
+        applied = self.chance(0.7, batch, device)
+        angles = torch.deg2rad(self.uniform(-self.rotation_limit, self.rotation_limit, batch, device)) * applied
+        scales = 1 + self.uniform(-self.scale_limit, self.scale_limit, batch, device) * applied
+        shifts = 2 * self.uniform(-self.shift_limit, self.shift_limit, (batch, 2), device) * applied.unsqueeze(1)
+        shift_scale_rotate = affine_matrices(angles, scales, shifts)
+
+        flip_x = torch.where(self.chance(0.5, batch, device), -ones, ones)
+        flip_y = torch.where(self.chance(0.3, batch, device), -ones, ones)
+        flips = torch.diag_embed(torch.stack([flip_x, flip_y, ones], 1))
+
+        theta = torch.linalg.inv(flips @ shift_scale_rotate @ rot90)[:, :2]
+        grid = F.affine_grid(theta, list(imgs.shape), align_corners=False)
+        return F.grid_sample(imgs, grid, mode='bilinear', padding_mode='reflection', align_corners=False)
+
+    def color(self, imgs):
+        batch, device = imgs.shape[0], imgs.device
+        applied = self.chance(0.5, (batch, 1, 1, 1), device)
+
+        def factor(amount):
+            return 1 + self.uniform(-min(amount, 1), amount, (batch, 1, 1, 1), device) * applied
+
+        imgs = (imgs * factor(self.brightness)).clamp(0, 1)
+        mean = grayscale(imgs).mean(dim=(1, 2, 3), keepdim=True)
+        imgs = (mean + (imgs - mean) * factor(self.contrast)).clamp(0, 1)
+        gray = grayscale(imgs)
+        imgs = (gray + (imgs - gray) * factor(self.saturation)).clamp(0, 1)
+
+        hsv = rgb_to_hsv(imgs)
+        hue = (hsv[:, 0:1] + self.uniform(-self.hue, self.hue, (batch, 1, 1, 1), device) * applied) % 1
+        return hsv_to_rgb(torch.cat([hue, hsv[:, 1:]], 1)).clamp(0, 1)
+
+    def blur(self, imgs, max_radius=3):
+        batch, channels, height, width = imgs.shape
+        device = imgs.device
+        radius = torch.randint(1, max_radius + 1, (batch, 1), device=device)
+        sigma = self.uniform(0.5, 3.0, (batch, 1), device)
+        offsets = torch.arange(-max_radius, max_radius + 1, device=device, dtype=imgs.dtype)
+
+        kernel = torch.exp(-offsets ** 2 / (2 * sigma ** 2)) * (offsets.abs() <= radius)
+        kernel = torch.where(self.chance(0.3, (batch, 1), device), kernel, (offsets == 0).to(imgs.dtype).expand(batch, -1))
+        kernel = (kernel / kernel.sum(1, keepdim=True)).repeat_interleave(channels, 0)
+
+        x = imgs.reshape(1, batch * channels, height, width)
+        x = F.conv2d(F.pad(x, (max_radius, max_radius, 0, 0), mode='reflect'), kernel.view(-1, 1, 1, kernel.shape[1]), groups=batch * channels)
+        x = F.conv2d(F.pad(x, (0, 0, max_radius, max_radius), mode='reflect'), kernel.view(-1, 1, kernel.shape[1], 1), groups=batch * channels)
+        return x.view(batch, channels, height, width)
+
+    def shadow(self, imgs, max_shadows=2, vertices=5, intensity=0.5):
+        batch, _, height, width = imgs.shape
+        device = imgs.device
+        top = height // 2
+        points = torch.rand(batch, max_shadows, vertices, 2, device=device)
+        xs = points[..., 0, None, None] * width
+        ys = (0.5 + 0.5 * points[..., 1, None, None]) * height
+        px = torch.arange(width, device=device).view(1, 1, 1, -1) + 0.5
+        py = torch.arange(top, height, device=device).view(1, 1, -1, 1) + 0.5
+
+        inside = torch.zeros(batch, max_shadows, height - top, width, dtype=torch.bool, device=device)
+        for i in range(vertices):
+            x0, y0 = xs[:, :, i], ys[:, :, i]
+            x1, y1 = xs[:, :, (i + 1) % vertices], ys[:, :, (i + 1) % vertices]
+            inside ^= ((y0 > py) != (y1 > py)) & (px < (x1 - x0) * (py - y0) / (y1 - y0) + x0)
+
+        shadows = torch.randint(1, max_shadows + 1, (batch, 1), device=device)
+        used = torch.arange(max_shadows, device=device) < shadows
+        mask = (inside & used[..., None, None]).any(1) & self.chance(0.3, (batch, 1, 1), device)
+
+        factor = torch.ones(batch, 1, height, width, device=device, dtype=imgs.dtype)
+        factor[:, :, top:] -= intensity * mask.unsqueeze(1).to(imgs.dtype)
+        return imgs * factor
+
+    def __call__(self, imgs):
+        with torch.no_grad():
+            imgs = imgs.float().div(255)
+            imgs = self.geometric(imgs)
+            imgs = self.color(imgs)
+            imgs = self.blur(imgs)
+            imgs = self.shadow(imgs)
+            mean = torch.tensor(MEAN, device=imgs.device).view(1, 3, 1, 1)
+            std = torch.tensor(STD, device=imgs.device).view(1, 3, 1, 1)
+            return (imgs - mean) / std
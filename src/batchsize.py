@@ -0,0 +1,158 @@
+import argparse, json, math, sys, threading, torch
+import torch.nn.functional as F
+import torch.multiprocessing as mp
+from src.precision import autocast, to_device
+from src.loadertuning import host_key
+from src.distributed import get_local_world_size
+from src.atomic import atomic_write
+from configs.paths import CACHE_DIR
+
+BATCH_SIZE_CACHE_PATH = CACHE_DIR / 'batch_size.json'
+PROBE_LIMIT = 1024
+probe_lock = threading.Lock()
+
+def is_out_of_memory(error):
+    return isinstance(error, torch.OutOfMemoryError) or 'out of memory' in str(error).lower()
+
+def training_step(model, device, batch_size, image_size, precision, channels_last):
+    generator = torch.Generator().manual_seed(batch_size)
+    imgs = to_device(torch.randn(batch_size, 3, image_size, image_size, generator=generator), device, channels_last)
+    labels = torch.zeros(batch_size, dtype=torch.long, device=device)
+    try:
+        with autocast(device, precision):
+            loss = F.cross_entropy(model(imgs), labels)
+        loss.backward()
+    finally:
+        model.zero_grad(set_to_none=True)
+
+def probe_cuda(model, device, image_size, precision, channels_last, start, limit):
+    def fits(batch_size):
+        try:
+            training_step(model, device, batch_size, image_size, precision, channels_last)
+            return True
+        except Exception as e:
+            if not is_out_of_memory(e):
+                raise
+            return False
+        finally:
+            torch.cuda.empty_cache()
+
+    low, high = 0, start
+    while high <= limit and fits(high):
+        low, high = high, high * 2
+    high = min(high, limit + 1)
+    while high - low > 1:
+        middle = (low + high) // 2
+        if fits(middle):
+            low = middle
+        else:
+            high = middle
+    return low
+
+def peak_memory_bytes():
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+def available_memory_bytes():
+    # MemAvailable counts reclaimable page cache, unlike SC_AVPHYS_PAGES, so it does not swing with the cache.
+    with open('/proc/meminfo') as f:
+        for line in f:
+            if line.startswith('MemAvailable:'):
+                return int(line.split()[1]) * 1024
+    raise OSError('MemAvailable missing from /proc/meminfo')
+
+def measure_peaks(model, image_size, precision, channels_last, batch_sizes, results):
+    peaks = []
+    for batch_size in batch_sizes:
+        training_step(model, torch.device('cpu'), batch_size, image_size, precision, channels_last)
+        peaks.append(peak_memory_bytes())
+    results.put(peaks)
+
+def probe_cpu(model, device, image_size, precision, channels_last, start, limit):
+    # Running out of host memory swaps or kills the process instead of raising, so the
+    # per-sample cost is measured from the peak RSS growth between two batch sizes and
+    # the largest batch is extrapolated from the memory that is still free. The steps run
+    # in a fresh process, whose lifetime peak is not already raised by earlier work.
+    try:
+        available = available_memory_bytes() / get_local_world_size()
+        import resource
+    except (ImportError, OSError, ValueError):
+        return None
+    context = mp.get_context('spawn')
+    results = context.SimpleQueue()
+    process = context.Process(target=measure_peaks, args=(model, image_size, precision, channels_last, (start, 4 * start), results))
+    process.start()
+    process.join()
+    if process.exitcode != 0 or results.empty():
+        return None
+    small, large = results.get()
+    if large <= small:
+        return None
+    per_sample = (large - small) / (3 * start)
+    return min(limit, 4 * start + int(available / per_sample))
+
+def probe_max_batch_size(model, device, image_size=224, precision='fp32', channels_last=False, start=8, limit=PROBE_LIMIT):
+    was_training = model.training
+    buffers = [(buffer, buffer.detach().clone()) for buffer in model.buffers()]
+    model.train()
+    try:
+        with torch.random.fork_rng(devices=[device] if device.type == 'cuda' else []):
+            probe = probe_cuda if device.type == 'cuda' else probe_cpu
+            return probe(model, device, image_size, precision, channels_last, start, limit)
+    finally:
+        with torch.no_grad():
+            for buffer, saved in buffers:
+                buffer.copy_(saved)
+        model.train(was_training)
+
+def load_batch_sizes():
+    if not BATCH_SIZE_CACHE_PATH.exists():
+        return {}
+    with open(BATCH_SIZE_CACHE_PATH) as f:
+        return json.load(f)
+
+def save_batch_size(name, batch_size):
+    batch_sizes = load_batch_sizes()
+    batch_sizes.setdefault(host_key(), {})[name] = batch_size
+    with atomic_write(BATCH_SIZE_CACHE_PATH) as f:
+        json.dump(batch_sizes, f, indent=2)
+
+def find_max_batch_size(model, device, model_name, image_size=224, precision='fp32', channels_last=False, start=8, safety=0.9, refresh=False):
+    name = f'{model_name}-{image_size}-{precision}{"-channels_last" if channels_last else ""}-{device.type}-x{get_local_world_size()}'
+    with probe_lock:
+        max_batch_size = None if refresh else load_batch_sizes().get(host_key(), {}).get(name)
+        if max_batch_size is None:
+            max_batch_size = probe_max_batch_size(model, device, image_size, precision, channels_last, start)
+            if max_batch_size is None:
+                print(f'Cannot measure free memory on {sys.platform}, training on batches of {start}')
+                return start
+            # A probe that reached the limit did not find the real maximum, so it is not cached.
+            if max_batch_size < PROBE_LIMIT:
+                save_batch_size(name, max_batch_size)
+    # Leave room for the optimizer state and the allocator fragmentation the probe does not see.
+    return max(1, int(max_batch_size * safety))
+
+def plan_batches(effective_batch_size, max_batch_size):
+    accumulation_steps = math.ceil(effective_batch_size / max(1, max_batch_size))
+    return math.ceil(effective_batch_size / accumulation_steps), accumulation_steps
+
+if __name__ == '__main__':
+    from src.model import get_model
+    from src.precision import resolve_precision, prepare_model
+    from configs.training import PRECISION, CHANNELS_LAST
+
+    parser = argparse.ArgumentParser(description='Find the largest training batch that fits in memory for a model and image size, and the gradient accumulation needed to reach an effective batch size.')
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--effective-batch-size', type=int, nargs='+', default=[32, 64, 128])
+    args = parser.parse_args()
+
+    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+    precision = resolve_precision(PRECISION, device)
+    model = prepare_model(get_model(model_name=args.model_name, num_classes=6, pretrained=False), device, CHANNELS_LAST)
+    max_batch_size = find_max_batch_size(model, device, args.model_name, args.image_size, precision, CHANNELS_LAST, refresh=True)
+    print(f'{args.model_name} at {args.image_size}px ({precision}, {device.type}): max batch size {max_batch_size}')
+    for effective_batch_size in args.effective_batch_size:
+        batch_size, accumulation_steps = plan_batches(effective_batch_size, max_batch_size)
+        print(f'effective batch size {effective_batch_size}: {accumulation_steps} x {batch_size}')
@@ -0,0 +1,91 @@
+import os, torch
+from src.trainer import Callback
+from src.atomic import atomic_write
+from configs.paths import CACHE_DIR
+
+COMPILE_CACHE_DIR = CACHE_DIR / 'torch_compile'
+COMPILE_BACKENDS = ('inductor', 'aot_eager', 'eager')
+COMPILE_MODES = ('default', 'reduce-overhead', 'max-autotune', 'max-autotune-no-cudagraphs')
+
+def enable_compile_cache(cache_dir=COMPILE_CACHE_DIR):
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    os.environ.setdefault('TORCHINDUCTOR_CACHE_DIR', str(cache_dir / 'inductor'))
+    os.environ.setdefault('TORCHINDUCTOR_FX_GRAPH_CACHE', '1')
+    os.environ.setdefault('TORCHINDUCTOR_AUTOGRAD_CACHE', '1')
+
+def artifacts_path(cache_name, device):
+    return COMPILE_CACHE_DIR / f'{cache_name}-{torch.device(device).type}-torch{torch.__version__}.bin'
+
+def load_compile_artifacts(cache_name, device):
+    path = artifacts_path(cache_name, device)
+    if not path.exists():
+        return False
+    try:
+        torch.compiler.load_cache_artifacts(path.read_bytes())
+        return True
+    except Exception as e:
+        print(f'Ignoring compile cache {path.name}: {e}')
+        return False
+
+def save_compile_artifacts(cache_name, device):
+    artifacts = torch.compiler.save_cache_artifacts()
+    if artifacts is None:
+        return None
+    path = artifacts_path(cache_name, device)
+    with atomic_write(path, 'wb') as f:
+        f.write(artifacts[0])
+    return path
+
+def compile_errors():
+    import torch._dynamo, torch._inductor.exc
+    return tuple(error for error in (torch._dynamo.exc.TorchDynamoException, getattr(torch._inductor.exc, 'InductorError', None)) if error is not None)
+
+class EagerFallback:
+    # torch.compile only compiles on the first call for each input shape, so that is where a
+    # failing backend (e.g. no C++ compiler for inductor) shows up. Later calls then run eagerly.
+    def __init__(self, compiled, model):
+        self.compiled = compiled
+        self.model = model
+
+    def __call__(self, *args, **kwargs):
+        if self.compiled is not None:
+            try:
+                return self.compiled(*args, **kwargs)
+            except compile_errors() as e:
+                print(f'torch.compile failed, running eagerly: {e}')
+                self.compiled = None
+        return self.model(*args, **kwargs)
+
+    def __getattr__(self, name):
+        return getattr(self.model, name)
+
+def is_compiled(model):
+    # False once EagerFallback has given up, or when compile_model returned the eager model.
+    return getattr(model, 'compiled', None) is not None
+
+def compile_model(model, backend='inductor', mode='default', cache_name=None, device='cpu'):
+    if backend not in COMPILE_BACKENDS:
+        raise ValueError(f'Unknown compile backend {backend!r}, expected one of {COMPILE_BACKENDS}')
+    if mode not in COMPILE_MODES:
+        raise ValueError(f'Unknown compile mode {mode!r}, expected one of {COMPILE_MODES}')
+
+    enable_compile_cache()
+    if cache_name is not None:
+        load_compile_artifacts(cache_name, device)
+
+    try:
+        return EagerFallback(torch.compile(model, backend=backend, mode=None if backend != 'inductor' else mode), model)
+    except RuntimeError as e:
+        print(f'torch.compile is not supported here, running eagerly: {e}')
+        return model
+
+class CompileCache(Callback):
+    def __init__(self, cache_name, device):
+        self.cache_name = cache_name
+        self.device = device
+        self.saved_stages = set()
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        if stage not in self.saved_stages and is_compiled(trainer.model):
+            save_compile_artifacts(self.cache_name, self.device)
+            self.saved_stages.add(stage)
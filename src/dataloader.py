@@ -1,39 +1,23 @@
-import shutil
 import albumentations as A
 from albumentations.pytorch import ToTensorV2
-from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
-from configs.paths import TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR, RAW_DATA_DIR
-from sklearn.model_selection import train_test_split
-from pathlib import Path
+from torchvision import transforms
+from torch.utils.data import DataLoader, DistributedSampler
+from src.imagecache import build_image_cache, CachedImageDataset
+from src.manifest import split_dataset, ManifestImageFolder
+from src.loadertuning import get_loader_config, loader_kwargs
+from src.resume import ResumableRandomSampler
+from src.distributed import get_rank, get_world_size, distributed_loader_config, ShardSampler
 import numpy as np
 
-class AlbumentationsDataset(datasets.ImageFolder):
+class AlbumentationsDataset(ManifestImageFolder):
     def __getitem__(self, index):
         path, target = self.samples[index]
         sample = self.loader(path)
         sample = self.transform(image=np.array(sample))['image']
         return sample, target
 
-def split_dataset(raw_dir: Path = RAW_DATA_DIR, test_size=0.1, val_size=0.1):
-    classes = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
-    
-    for _class in classes:
-        CLASS_DIR = raw_dir / _class
-        images = list(CLASS_DIR.glob('*.jpg')) + list(CLASS_DIR.glob('*.png'))
-
-        train_val, test = train_test_split(images, test_size=test_size, random_state=42)
-        train, validation = train_test_split(train_val, test_size=val_size / (1 - test_size), random_state=42)
-
-        for split, imgs, split_dir in zip(['train', 'validation', 'test'], [train, validation, test], [TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR]):
-            split_class_dir = split_dir / _class
-            split_class_dir.mkdir(parents=True, exist_ok=True)
-
-            for img in imgs:
-                shutil.copy(img, split_class_dir / img.name)
-
-def get_dataloaders(batch_size=64, image_size=224):
-    transform_train = A.Compose([
+def build_train_transform(image_size=224):
+    return A.Compose([
         A.Resize(image_size, image_size),
         A.RandomRotate90(p=0.5),
         A.ShiftScaleRotate(shift_limit=0.1, scale_limit=0.15, rotate_limit=30, p=0.7),
@@ -45,18 +29,78 @@ def get_dataloaders(batch_size=64, image_size=224):
         A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
         ToTensorV2()
     ])
-    transform_val = transforms.Compose([
+
+def build_batch_train_transform(image_size=224):
+    return A.Compose([
+        A.Resize(image_size, image_size),
+        ToTensorV2()
+    ])
+
+def build_eval_transform(image_size=224):
+    return transforms.Compose([
         transforms.Resize((image_size, image_size)),
         transforms.ToTensor(),
         transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
     ])
 
-    train_dataset = AlbumentationsDataset(TRAIN_DATA_DIR, transform=transform_train)
-    validation_dataset = datasets.ImageFolder(VAL_DATA_DIR, transform=transform_val)
-    test_dataset = datasets.ImageFolder(TEST_DATA_DIR, transform=transform_val)
+def build_cached_eval_transform(image_size=224):
+    return A.Compose([
+        A.Resize(image_size, image_size),
+        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ToTensorV2()
+    ])
+
+def get_dataloaders(batch_size=64, image_size=224, use_cache=False, cache_size=None, augmentation_backend='albumentations', resumable=False, distributed=False):
+    if augmentation_backend == 'batch':
+        transform_train = build_batch_train_transform(image_size)
+    else:
+        transform_train = build_train_transform(image_size)
+    transform_val = build_eval_transform(image_size)
+
+    if use_cache:
+        cache_size = cache_size or image_size
+        transform_cached = build_cached_eval_transform(image_size)
+        cached = {}
+        for split in ['train', 'validation', 'test']:
+            folder = ManifestImageFolder(split)
+            cached[split] = build_image_cache(folder.samples, folder.classes, cache_size)
+
+        train_dataset = CachedImageDataset(cached['train'], transform=transform_train)
+        validation_dataset = CachedImageDataset(cached['validation'], transform=transform_cached)
+        test_dataset = CachedImageDataset(cached['test'], transform=transform_cached)
+    else:
+        train_dataset = AlbumentationsDataset('train', transform=transform_train)
+        validation_dataset = ManifestImageFolder('validation', transform=transform_val)
+        test_dataset = ManifestImageFolder('test', transform=transform_val)
+
+    loader_name = 'train_cached' if use_cache else 'train'
+    if augmentation_backend == 'batch':
+        loader_name += '_batch'
+    loader_config = get_loader_config(loader_name, train_dataset, batch_size)
+    if distributed:
+        loader_config = distributed_loader_config(loader_config)
+        if resumable:
+            train_sampler = ResumableRandomSampler(train_dataset, num_replicas=get_world_size(), rank=get_rank())
+        else:
+            train_sampler = DistributedSampler(train_dataset, shuffle=True, seed=42)
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=train_sampler, **loader_kwargs(loader_config, persistent_workers=True))
+        validation_loader = DataLoader(validation_dataset, batch_size=batch_size, sampler=ShardSampler(validation_dataset), **loader_kwargs(loader_config, persistent_workers=True))
+    else:
+        if resumable:
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=ResumableRandomSampler(train_dataset), **loader_kwargs(loader_config, persistent_workers=True))
+        else:
+            train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, **loader_kwargs(loader_config, persistent_workers=True))
+        validation_loader = DataLoader(validation_dataset, batch_size=batch_size, shuffle=False, **loader_kwargs(loader_config, persistent_workers=True))
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, **loader_kwargs(loader_config))
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=12, prefetch_factor=4, pin_memory=True, persistent_workers=True)
-    validation_loader = DataLoader(validation_dataset, batch_size=batch_size, shuffle=False, num_workers=8, prefetch_factor=4, pin_memory=True, persistent_workers=True)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
+    return train_loader, validation_loader, test_loader
 
-    return train_loader, validation_loader, test_loader 
\ No newline at end of file
+def get_eval_loader(split='test', batch_size=64, image_size=224, use_cache=False, cache_size=None):
+    if use_cache:
+        folder = ManifestImageFolder(split)
+        dataset = CachedImageDataset(build_image_cache(folder.samples, folder.classes, cache_size or image_size), transform=build_cached_eval_transform(image_size))
+    else:
+        dataset = ManifestImageFolder(split, transform=build_eval_transform(image_size))
+    # Reuse the training loader settings if they were tuned, but never tune just to read one split.
+    loader_config = get_loader_config('train_cached' if use_cache else 'train')
+    return DataLoader(dataset, batch_size=batch_size, shuffle=False, **loader_kwargs(loader_config)) 
\ No newline at end of file
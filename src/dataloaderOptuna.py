@@ -1,35 +1,84 @@
-import shutil, albumentations as A
+import albumentations as A
 from albumentations.pytorch import ToTensorV2
-from torchvision import datasets, transforms
-from torch.utils.data import DataLoader
-from configs.paths import TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR, RAW_DATA_DIR
-from sklearn.model_selection import train_test_split
-from pathlib import Path
+from torchvision import transforms
+import multiprocessing as mp
+from torch.utils.data import DataLoader, Dataset, BatchSampler, RandomSampler, SequentialSampler
+from src.imagecache import build_image_cache, CachedImageDataset
+from src.manifest import split_dataset, ManifestImageFolder
+from src.dataloader import build_batch_train_transform
+from src.loadertuning import get_loader_config, loader_kwargs
 import numpy as np
 
-class AlbumentationsDataset(datasets.ImageFolder):
+class AlbumentationsDataset(ManifestImageFolder):
         def __getitem__(self, index):
             path, target = self.samples[index]
             sample = self.loader(path)
             sample = self.transform(image=np.array(sample))['image']
             return sample, target
 
-def split_dataset(raw_dir: Path = RAW_DATA_DIR, test_size=0.1, val_size=0.1):
-    classes = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
-    
-    for _class in classes:
-        CLASS_DIR = raw_dir / _class
-        images = list(CLASS_DIR.glob('*.jpg')) + list(CLASS_DIR.glob('*.png'))
+AUGMENTATION_PARAMS = ('rotation_limit', 'shift_limit', 'scale_limit', 'brightness', 'contrast', 'saturation', 'hue')
 
-        train_val, test = train_test_split(images, test_size=test_size, random_state=42)
-        train, validation = train_test_split(train_val, test_size=val_size / (1 - test_size), random_state=42)
+def build_train_transform(image_size, rotation_limit, shift_limit, scale_limit, brightness, contrast, saturation, hue):
+    return A.Compose([
+        A.Resize(image_size, image_size),
+        A.RandomRotate90(p=0.5),
+        A.ShiftScaleRotate(shift_limit=shift_limit, scale_limit=scale_limit, rotate_limit=rotation_limit, p=0.7),
+        A.HorizontalFlip(p=0.5),
+        A.VerticalFlip(p=0.3),
+        A.ColorJitter(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue, p=0.5),
+        A.GaussianBlur(blur_limit=(3, 7), p=0.3),
+        A.RandomShadow(p=0.3),
+        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+        ToTensorV2()
+    ])
+
+class SharedAugmentation:
+    def __init__(self, **params):
+        self.values = mp.RawArray('d', len(AUGMENTATION_PARAMS) + 1)
+        self.update(**params)
+
+    def update(self, **params):
+        for i, name in enumerate(AUGMENTATION_PARAMS):
+            self.values[i] = params[name]
+        self.values[-1] += 1
+
+    @property
+    def version(self):
+        return self.values[-1]
+
+    def params(self):
+        params = {name: self.values[i] for i, name in enumerate(AUGMENTATION_PARAMS)}
+        params['rotation_limit'] = int(params['rotation_limit'])
+        return params
+
+class SharedAugmentationDataset(Dataset):
+    def __init__(self, dataset, image_size, augmentation):
+        self.dataset = dataset
+        self.image_size = image_size
+        self.augmentation = augmentation
+        self.version = None
 
-        for split, imgs, split_dir in zip(['train', 'validation', 'test'], [train, validation, test], [TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR]):
-            split_class_dir = split_dir / _class
-            split_class_dir.mkdir(parents=True, exist_ok=True)
+    def __len__(self):
+        return len(self.dataset)
 
-            for img in imgs:
-                shutil.copy(img, split_class_dir / img.name)
+    @property
+    def samples(self):
+        return self.dataset.samples
+
+    @property
+    def classes(self):
+        return self.dataset.classes
+
+    @property
+    def transform(self):
+        if self.version != self.augmentation.version:
+            self.dataset.transform = build_train_transform(self.image_size, **self.augmentation.params())
+            self.version = self.augmentation.version
+        return self.dataset.transform
+
+    def __getitem__(self, index):
+        self.transform
+        return self.dataset[index]
 
 def get_dataloaders(
     batch_size=32,
@@ -40,32 +89,56 @@ def get_dataloaders(
     brightness=0.2,
     contrast=0.2,
     saturation=0.2,
-    hue=0.1
+    hue=0.1,
+    use_cache=False,
+    cache_size=None,
+    augmentation=None,
+    augmentation_backend='albumentations'
 ):
-    transform_train = A.Compose([
-        A.Resize(image_size, image_size),
-        A.RandomRotate90(p=0.5),
-        A.ShiftScaleRotate(shift_limit=shift_limit, scale_limit=scale_limit, rotate_limit=rotation_limit, p=0.7),
-        A.HorizontalFlip(p=0.5),
-        A.VerticalFlip(p=0.3),
-        A.ColorJitter(brightness=brightness, contrast=contrast, saturation=saturation, hue=hue, p=0.5),
-        A.GaussianBlur(blur_limit=(3, 7), p=0.3),
-        A.RandomShadow(p=0.3),
-        A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
-        ToTensorV2()
-    ])
+    if augmentation_backend == 'batch':
+        transform_train = build_batch_train_transform(image_size)
+    else:
+        transform_train = build_train_transform(image_size, rotation_limit, shift_limit, scale_limit, brightness, contrast, saturation, hue)
     transform_val = transforms.Compose([
         transforms.Resize((image_size, image_size)),
         transforms.ToTensor(),
         transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
     ])
 
-    train_dataset = AlbumentationsDataset(TRAIN_DATA_DIR, transform=transform_train)
-    validation_dataset = datasets.ImageFolder(VAL_DATA_DIR, transform=transform_val)
-    test_dataset = datasets.ImageFolder(TEST_DATA_DIR, transform=transform_val)
+    if use_cache:
+        cache_size = cache_size or image_size
+        transform_cached = A.Compose([
+            A.Resize(image_size, image_size),
+            A.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225]),
+            ToTensorV2()
+        ])
+        cached = {}
+        for split in ['train', 'validation', 'test']:
+            folder = ManifestImageFolder(split)
+            cached[split] = build_image_cache(folder.samples, folder.classes, cache_size)
+
+        train_dataset = CachedImageDataset(cached['train'], transform=transform_train)
+        validation_dataset = CachedImageDataset(cached['validation'], transform=transform_cached)
+        test_dataset = CachedImageDataset(cached['test'], transform=transform_cached)
+    else:
+        train_dataset = AlbumentationsDataset('train', transform=transform_train)
+        validation_dataset = ManifestImageFolder('validation', transform=transform_val)
+        test_dataset = ManifestImageFolder('test', transform=transform_val)
 
-    train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, num_workers=12, prefetch_factor=4, pin_memory=True, persistent_workers=True)
-    validation_loader = DataLoader(validation_dataset, batch_size=batch_size, shuffle=False, num_workers=8, prefetch_factor=4, pin_memory=True, persistent_workers=True)
-    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=True, num_workers=4)
+    loader_name = 'train_cached' if use_cache else 'train'
+    if augmentation_backend == 'batch':
+        loader_name += '_batch'
+    loader_config = get_loader_config(loader_name, train_dataset, batch_size)
+    if augmentation is not None:
+        if augmentation_backend != 'batch':
+            train_dataset = SharedAugmentationDataset(train_dataset, image_size, augmentation)
+        train_sampler = BatchSampler(RandomSampler(train_dataset), batch_size, drop_last=False)
+        validation_sampler = BatchSampler(SequentialSampler(validation_dataset), batch_size, drop_last=False)
+        train_loader = DataLoader(train_dataset, batch_sampler=train_sampler, **loader_kwargs(loader_config, persistent_workers=True))
+        validation_loader = DataLoader(validation_dataset, batch_sampler=validation_sampler, **loader_kwargs(loader_config, persistent_workers=True))
+    else:
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True, **loader_kwargs(loader_config, persistent_workers=True))
+        validation_loader = DataLoader(validation_dataset, batch_size=batch_size, shuffle=False, **loader_kwargs(loader_config, persistent_workers=True))
+    test_loader = DataLoader(test_dataset, batch_size=batch_size, shuffle=False, **loader_kwargs(loader_config))
 
     return train_loader, validation_loader, test_loader 
\ No newline at end of file
@@ -0,0 +1,75 @@
+import os, torch
+import torch.distributed as dist
+from contextlib import contextmanager
+from torch.nn.parallel import DistributedDataParallel
+from torch.utils.data import Sampler
+
+def is_distributed():
+    return dist.is_available() and dist.is_initialized()
+
+def get_rank():
+    return dist.get_rank() if is_distributed() else 0
+
+def get_world_size():
+    return dist.get_world_size() if is_distributed() else 1
+
+def get_local_world_size():
+    return int(os.environ.get('LOCAL_WORLD_SIZE', get_world_size()))
+
+def is_main_process():
+    return get_rank() == 0
+
+def init_distributed(backend='gloo'):
+    if int(os.environ.get('WORLD_SIZE', 1)) <= 1:
+        return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+    dist.init_process_group(backend=backend)
+    torch.set_num_threads(max(1, (os.cpu_count() or 1) // get_local_world_size()))
+    if torch.cuda.is_available():
+        local_rank = int(os.environ.get('LOCAL_RANK', 0))
+        torch.cuda.set_device(local_rank)
+        return torch.device('cuda', local_rank)
+    return torch.device('cpu')
+
+def cleanup_distributed():
+    if is_distributed():
+        dist.destroy_process_group()
+
+def barrier():
+    if is_distributed():
+        dist.barrier()
+
+@contextmanager
+def main_process_first():
+    if not is_main_process():
+        barrier()
+    yield
+    if is_main_process():
+        barrier()
+
+def all_reduce_sum(tensor):
+    if is_distributed():
+        dist.all_reduce(tensor, op=dist.ReduceOp.SUM)
+    return tensor
+
+def wrap_model(model, device):
+    if not is_distributed():
+        return model
+    return DistributedDataParallel(model, device_ids=[device.index] if device.type == 'cuda' else None)
+
+class ShardSampler(Sampler):
+    # Unlike DistributedSampler, the shards are not padded to equal length, so every sample is
+    # counted exactly once when the per-process sums are all-reduced.
+    def __init__(self, data_source, num_replicas=None, rank=None):
+        self.data_source = data_source
+        self.num_replicas = get_world_size() if num_replicas is None else num_replicas
+        self.rank = get_rank() if rank is None else rank
+
+    def __iter__(self):
+        return iter(range(self.rank, len(self.data_source), self.num_replicas))
+
+    def __len__(self):
+        return len(range(self.rank, len(self.data_source), self.num_replicas))
+
+def distributed_loader_config(config):
+    return dict(config, num_workers=config['num_workers'] // get_local_world_size())
@@ -1,76 +1,109 @@
-import torch
-from src.model import get_model
-from PIL import Image
-from torchvision import transforms
-from src.dataloader import get_dataloaders
-from sklearn.metrics import confusion_matrix, ConfusionMatrixDisplay
-import matplotlib.pyplot as plt
-from configs.paths import MODELS_DIR
-
-def evaluate_test_set(checkpoint_path=(MODELS_DIR / 'stage2_best.pth')):
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = get_model(model_name='densenet201', num_classes=6, pretrained=False)
-    model.load_state_dict(torch.load(checkpoint_path, weights_only=True))
-    model.to(device)
-    model.eval()
-
-    _, _, test_loader = get_dataloaders()
-
-    correct = 0
-    total = 0
-    all_predictions = []
-    all_labels = []
-    
+import time, torch
+from src.predictor import CLASSES, registry, get_predictor, default_device
+from src.backends import CPU_BACKENDS, infer_backend
+from src.tta import predict_tta, MAX_TTA_VIEWS
+from src.metrics import StreamingMetrics, save_report
+from configs.paths import MODELS_DIR, EVALUATION_REPORT_PATH
+from configs.training import IMAGE_CACHE, IMAGE_CACHE_SIZE
+
+def run_test_set(models, test_loader, tta_views=1):
+    metrics = [StreamingMetrics(len(CLASSES), device) for _, device in models]
+
     with torch.no_grad():
         for imgs, labels in test_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            outputs = model(imgs)
-            _, predicted = torch.max(outputs, 1)
-            total += labels.size(0)
-            correct += (predicted == labels).sum().item()
-            all_predictions.extend(predicted.cpu().numpy())
-            all_labels.extend(labels.cpu().numpy())
-
-    accuracy = 100 * correct / total
-    print(f'Test Accuracy: {accuracy:.2f}%')
-
-    cm = confusion_matrix(all_labels, all_predictions)
-    display = ConfusionMatrixDisplay(confusion_matrix=cm, display_labels=['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash'])
+            for (model, device), model_metrics in zip(models, metrics):
+                start = time.perf_counter()
+                probabilities = predict_tta(model, imgs.to(device), tta_views)
+                if device.type == 'cuda':
+                    torch.cuda.synchronize(device)
+                model_metrics.seconds += time.perf_counter() - start
+                model_metrics.update(probabilities, labels.to(device))
+
+    return [model_metrics.compute(CLASSES) for model_metrics in metrics]
+
+def evaluate_checkpoints(checkpoint_paths, model_name='densenet201', tta_views=1, backend=None, compile=False, report_path=EVALUATION_REPORT_PATH):
+    from src.dataloader import get_eval_loader
+
+    models = []
+    backends = []
+    for checkpoint_path in checkpoint_paths:
+        checkpoint_backend = backend or infer_backend(checkpoint_path)
+        device = torch.device('cpu') if checkpoint_backend in CPU_BACKENDS else default_device()
+        models.append((registry.get(checkpoint_path, model_name=model_name, device=device, backend=checkpoint_backend, compile=compile), device))
+        backends.append(checkpoint_backend)
+
+    test_loader = get_eval_loader('test', use_cache=IMAGE_CACHE, cache_size=IMAGE_CACHE_SIZE)
+
+    reports = {
+        str(checkpoint_path): {'backend': checkpoint_backend, 'tta_views': tta_views, **report}
+        for checkpoint_path, checkpoint_backend, report in zip(checkpoint_paths, backends, run_test_set(models, test_loader, tta_views))
+    }
+    if report_path is not None:
+        save_report(reports, report_path)
+    return reports
+
+def evaluate_test_set(checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), tta_views=1, model_name='densenet201', backend=None, plot=True, compile=False, report_path=EVALUATION_REPORT_PATH):
+    report = evaluate_checkpoints([checkpoint_path], model_name, tta_views, backend, compile, report_path)[str(checkpoint_path)]
+    print(f'Test Accuracy: {report["accuracy"]:.2f}%')
+    if not plot:
+        return report['accuracy']
+
+    import numpy as np
+    from sklearn.metrics import ConfusionMatrixDisplay
+    import matplotlib.pyplot as plt
+
+    display = ConfusionMatrixDisplay(confusion_matrix=np.array(report['confusion_matrix']), display_labels=CLASSES)
     display.plot()
     plt.show()
+    return report['accuracy']
 
-def predict_image(image_path, checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), image_size=224):
-    classes = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
+def print_reports(reports):
+    print(f'{"checkpoint":<40}{"accuracy":>10}{"top3":>9}{"macro F1":>10}{"ECE":>8}{"ms/image":>10}')
+    for checkpoint_path, report in reports.items():
+        top3 = report['top_k_accuracy'].get('top3', float('nan'))
+        print(f'{checkpoint_path:<40}{report["accuracy"]:>9.2f}%{top3:>8.2f}%{report["macro_f1"]:>10.3f}{report["expected_calibration_error"]:>8.3f}{report["ms_per_image"]:>10.2f}')
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = get_model(model_name='densenet201', num_classes=6)
-    model.load_state_dict(torch.load(checkpoint_path, map_location=device, weights_only=True))
-    model.to(device)
-    model.eval()
+def tta_report(checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), view_counts=(1, 2, 4, 6, MAX_TTA_VIEWS), model_name='densenet201'):
+    from src.dataloader import get_eval_loader
 
-    transform = transforms.Compose([
-        transforms.Resize((image_size, image_size)),
-        transforms.ToTensor(),
-        transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-    ])
+    device = default_device()
+    model = registry.get(checkpoint_path, model_name=model_name, device=device)
+    test_loader = get_eval_loader('test', use_cache=IMAGE_CACHE, cache_size=IMAGE_CACHE_SIZE)
 
-    image = Image.open(image_path).convert('RGB')
-    image_tensor = transform(image).unsqueeze(0).to(device)
+    print(f'{"views":<8}{"accuracy":>10}{"ms/image":>10}')
+    results = []
+    for tta_views in view_counts:
+        report, = run_test_set([(model, device)], test_loader, tta_views)
+        results.append((tta_views, report['accuracy'], report['ms_per_image'] / 1000))
+        print(f'{tta_views:<8}{report["accuracy"]:>9.2f}%{report["ms_per_image"]:>10.2f}')
+    return results
 
-    with torch.no_grad():
-        outputs = model(image_tensor)
-        _, predicted = torch.max(outputs, 1)
-        confidence = torch.softmax(outputs, dim=1)[0][predicted].item()
-
-    predicted_class = classes[predicted.item()]
+def predict_image(image_path, checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), image_size=224, tta_views=1, compile=False, model_name='densenet201'):
+    predictor = get_predictor(checkpoint_path=checkpoint_path, model_name=model_name, image_size=image_size, tta_views=tta_views, compile=compile)
+    predicted_class, confidence = predictor.predict(image_path)
     print(f'Predicted: {predicted_class} (Confidence: {confidence * 100:.2f}%)')
     return predicted_class, confidence
 
 if __name__ == '__main__':
-    import sys
-    if len(sys.argv) > 1:
-        image_path = sys.argv[1]
-        predict_image(image_path)
+    import argparse
+    from src.model import MODEL_NAMES
+
+    parser = argparse.ArgumentParser(description='Evaluate checkpoints on the test set, or classify a single image.')
+    parser.add_argument('image_path', nargs='?', default=None, help='Classify this image instead of evaluating the test set')
+    parser.add_argument('--checkpoints', nargs='+', default=None, help='Evaluate these checkpoints in one pass over the test set and print a comparison')
+    parser.add_argument('--tta', type=int, default=1, help=f'Test-time augmentation views (1 to {MAX_TTA_VIEWS})')
+    parser.add_argument('--tta-report', action='store_true', help='Print the accuracy and latency for each view count')
+    parser.add_argument('--compile', action='store_true', help='Run the model with torch.compile')
+    parser.add_argument('--model-name', choices=list(MODEL_NAMES), default='densenet201', help='Architecture of the checkpoints (mobilenetv4 for the Optuna trainer)')
+    args = parser.parse_args()
+    model_name = MODEL_NAMES[args.model_name]
+
+    if args.tta_report:
+        tta_report(model_name=model_name)
+    elif args.checkpoints:
+        print_reports(evaluate_checkpoints(args.checkpoints, model_name=model_name, tta_views=args.tta, compile=args.compile))
+        print(f'Report written to {EVALUATION_REPORT_PATH}')
+    elif args.image_path:
+        predict_image(args.image_path, tta_views=args.tta, compile=args.compile, model_name=model_name)
     else:
-        evaluate_test_set()
-        print('Usage: python src/evaluate.py <image_path>')
\ No newline at end of file
+        evaluate_test_set(tta_views=args.tta, model_name=model_name, compile=args.compile)
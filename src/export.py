@@ -0,0 +1,99 @@
+import argparse, time, torch
+from pathlib import Path
+from timm.layers import set_exportable
+from src.model import load_state_dict, build_model_from_state_dict
+from src.backends import load_torchscript_model, OnnxModel
+from src.atomic import atomic_path
+from configs.paths import MODELS_DIR
+
+EXPORT_FORMATS = ('torchscript', 'onnx')
+
+def load_export_model(checkpoint_path, model_name='densenet201', num_classes=6):
+    with set_exportable(True):
+        model = build_model_from_state_dict(load_state_dict(checkpoint_path), model_name=model_name, num_classes=num_classes)
+    model.eval()
+    return model
+
+def export_torchscript(model, path, image_size=224):
+    example = torch.randn(1, 3, image_size, image_size)
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, example))
+    with atomic_path(path) as tmp_path:
+        traced.save(str(tmp_path))
+    return path
+
+def export_onnx(model, path, image_size=224, opset_version=17):
+    example = torch.randn(1, 3, image_size, image_size)
+    with atomic_path(path) as tmp_path, torch.no_grad():
+        torch.onnx.export(
+            model,
+            (example,),
+            str(tmp_path),
+            input_names=['image'],
+            output_names=['logits'],
+            dynamic_axes={'image': {0: 'batch'}, 'logits': {0: 'batch'}},
+            opset_version=opset_version,
+            dynamo=False
+        )
+    return path
+
+def check_parity(model, exported, image_size=224, batch_sizes=(1, 4), atol=1e-3, rtol=1e-3):
+    generator = torch.Generator().manual_seed(0)
+    max_error = 0.0
+    for batch_size in batch_sizes:
+        imgs = torch.randn(batch_size, 3, image_size, image_size, generator=generator)
+        with torch.no_grad():
+            expected = model(imgs)
+            actual = exported(imgs).cpu().float()
+
+        if actual.shape != expected.shape:
+            raise ValueError(f'Exported model returned shape {tuple(actual.shape)} for batch size {batch_size}, expected {tuple(expected.shape)}')
+        if not torch.allclose(actual, expected, atol=atol, rtol=rtol):
+            raise ValueError(f'Exported model differs from the checkpoint by up to {(actual - expected).abs().max().item():.2e} for batch size {batch_size}')
+        if not torch.equal(actual.argmax(1), expected.argmax(1)):
+            raise ValueError(f'Exported model predicts different classes for batch size {batch_size}')
+        max_error = max(max_error, (actual - expected).abs().max().item())
+    return max_error
+
+def single_image_latency(model, image_size=224, runs=20):
+    image = torch.randn(1, 3, image_size, image_size)
+    with torch.no_grad():
+        model(image)
+        start = time.perf_counter()
+        for _ in range(runs):
+            model(image)
+    return (time.perf_counter() - start) / runs
+
+def export_checkpoint(checkpoint_path, model_name='densenet201', formats=EXPORT_FORMATS, image_size=224, out_dir=None):
+    checkpoint_path = Path(checkpoint_path)
+    out_dir = Path(out_dir) if out_dir is not None else checkpoint_path.parent
+    out_dir.mkdir(parents=True, exist_ok=True)
+    model = load_export_model(checkpoint_path, model_name=model_name)
+    print(f'torch: {single_image_latency(model, image_size) * 1000:.1f} ms/image')
+
+    exported = {}
+    for export_format in formats:
+        if export_format == 'torchscript':
+            path = export_torchscript(model, out_dir / f'{checkpoint_path.stem}.pt', image_size)
+            runner = load_torchscript_model(path)
+        elif export_format == 'onnx':
+            path = export_onnx(model, out_dir / f'{checkpoint_path.stem}.onnx', image_size)
+            runner = OnnxModel(path)
+        else:
+            raise ValueError(f'Unknown export format {export_format!r}, expected one of {EXPORT_FORMATS}')
+
+        max_error = check_parity(model, runner, image_size)
+        print(f'{export_format}: {path} (max abs difference {max_error:.2e}, {single_image_latency(runner, image_size) * 1000:.1f} ms/image)')
+        exported[export_format] = path
+    return exported
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a trained checkpoint to TorchScript and ONNX and check that the exported models match it.')
+    parser.add_argument('--checkpoint', default=str(MODELS_DIR / 'stage2_best.pth'))
+    parser.add_argument('--model-name', default='densenet201', help='e.g. densenet201 or mobilenetv4_hybrid_medium.e500_r224_in1k')
+    parser.add_argument('--formats', nargs='+', choices=EXPORT_FORMATS, default=list(EXPORT_FORMATS))
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--out-dir', default=None, help='Defaults to the checkpoint directory')
+    args = parser.parse_args()
+
+    export_checkpoint(args.checkpoint, model_name=args.model_name, formats=args.formats, image_size=args.image_size, out_dir=args.out_dir)
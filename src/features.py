@@ -0,0 +1,108 @@
+import hashlib, json, os, torch
+import numpy as np
+from torch.utils.data import Dataset, DataLoader, DistributedSampler
+from src.precision import autocast
+from src.atomic import atomic_directory, key_lock
+from src.distributed import ShardSampler
+from src.manifest import load_manifest, file_digest
+from configs.paths import FEATURES_DIR, RAW_DATA_DIR
+
+class FeatureDataset(Dataset):
+    def __init__(self, store_dir):
+        self.features = np.load(store_dir / 'features.npy', mmap_mode='r')
+        self.labels = np.load(store_dir / 'labels.npy', mmap_mode='r')
+
+    def __len__(self):
+        return len(self.labels)
+
+    def __getitem__(self, index):
+        return torch.from_numpy(np.array(self.features[index])), int(self.labels[index])
+
+def tensor_bytes(tensor):
+    return tensor.detach().cpu().contiguous().reshape(-1).view(torch.uint8).numpy().tobytes()
+
+def fingerprint_backbone(model):
+    classifier = {id(tensor) for tensor in model.get_classifier().state_dict(keep_vars=True).values()}
+    digest = hashlib.sha1(type(model).__name__.encode())
+    for name, tensor in model.state_dict(keep_vars=True).items():
+        if id(tensor) in classifier:
+            continue
+        digest.update(name.encode())
+        digest.update(tensor_bytes(tensor))
+    return digest.hexdigest()
+
+def fingerprint_samples(samples):
+    # split_dataset keeps a SHA-1 of every raw image in the manifest, so only files outside it are read.
+    manifest = load_manifest()
+    raw_dir = manifest.get('raw_dir', str(RAW_DATA_DIR))
+    digests = {os.path.join(raw_dir, entry['path']): entry['sha1'] for entry in manifest['entries']}
+    digest = hashlib.sha1()
+    for path, target in samples:
+        sha1 = digests.get(str(path))
+        if sha1 is None:
+            sha1 = file_digest(path)
+        digest.update(sha1.encode())
+        digest.update(str(target).encode())
+    return digest.hexdigest()
+
+def feature_store_key(model, dataset, augmentations, batch_transform=None):
+    digest = hashlib.sha1()
+    digest.update(fingerprint_backbone(model).encode())
+    digest.update(fingerprint_samples(dataset.samples).encode())
+    digest.update(repr(dataset.transform).encode())
+    digest.update(repr(batch_transform).encode())
+    digest.update(str(augmentations).encode())
+    return digest.hexdigest()[:16]
+
+def extract_features(model, dataset, device, augmentations=1, batch_size=64, num_workers=4, precision='fp32', batch_transform=None):
+    store_dir = FEATURES_DIR / feature_store_key(model, dataset, augmentations, batch_transform)
+    with key_lock(store_dir):
+        if (store_dir / 'meta.json').exists():
+            return store_dir
+        with atomic_directory(store_dir) as tmp_dir:
+            write_features(model, dataset, device, tmp_dir, augmentations, batch_size, num_workers, precision, batch_transform)
+    return store_dir
+
+def write_features(model, dataset, device, tmp_dir, augmentations, batch_size, num_workers, precision, batch_transform):
+    num_samples = len(dataset) * augmentations
+    features = None
+    labels = np.lib.format.open_memmap(tmp_dir / 'labels.npy', mode='w+', dtype=np.int64, shape=(num_samples,))
+
+    was_training = model.training
+    model.eval()
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=False, num_workers=num_workers)
+    offset = 0
+    with torch.no_grad():
+        for _ in range(augmentations):
+            for imgs, targets in loader:
+                imgs = imgs.to(device)
+                if batch_transform is not None:
+                    imgs = batch_transform(imgs)
+                with autocast(device, precision):
+                    pooled = model.forward_head(model.forward_features(imgs), pre_logits=True)
+                if features is None:
+                    features = np.lib.format.open_memmap(tmp_dir / 'features.npy', mode='w+', dtype=np.float32, shape=(num_samples, pooled.shape[1]))
+                features[offset:offset + len(targets)] = pooled.float().cpu().numpy()
+                labels[offset:offset + len(targets)] = targets.numpy()
+                offset += len(targets)
+    model.train(was_training)
+
+    num_features = features.shape[1]
+    features.flush()
+    labels.flush()
+    del features, labels
+    with open(tmp_dir / 'meta.json', 'w') as f:
+        json.dump({'num_samples': num_samples, 'num_features': num_features, 'augmentations': augmentations, 'classes': dataset.classes}, f)
+
+def get_feature_loaders(model, train_dataset, validation_dataset, device, augmentations=1, batch_size=64, precision='fp32', batch_transform=None, distributed=False):
+    train_store = extract_features(model, train_dataset, device, augmentations=augmentations, batch_size=batch_size, precision=precision, batch_transform=batch_transform)
+    validation_store = extract_features(model, validation_dataset, device, augmentations=1, batch_size=batch_size, precision=precision)
+
+    train_dataset, validation_dataset = FeatureDataset(train_store), FeatureDataset(validation_store)
+    if distributed:
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, sampler=DistributedSampler(train_dataset, shuffle=True, seed=42))
+        validation_loader = DataLoader(validation_dataset, batch_size=batch_size, sampler=ShardSampler(validation_dataset))
+    else:
+        train_loader = DataLoader(train_dataset, batch_size=batch_size, shuffle=True)
+        validation_loader = DataLoader(validation_dataset, batch_size=batch_size, shuffle=False)
+    return train_loader, validation_loader
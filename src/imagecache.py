@@ -0,0 +1,65 @@
+import hashlib, json, os
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from PIL import Image
+from torch.utils.data import Dataset
+from src.atomic import atomic_directory, key_lock
+from configs.paths import IMAGE_CACHE_DIR
+
+def load_resized(path, size):
+    with Image.open(path) as image:
+        return np.asarray(image.convert('RGB').resize((size, size), Image.Resampling.BILINEAR))
+
+def image_cache_key(samples, size):
+    digest = hashlib.sha1(str(size).encode())
+    for path, target in samples:
+        stat = os.stat(path)
+        digest.update(f'{path}|{target}|{stat.st_size}|{stat.st_mtime_ns}'.encode())
+    return digest.hexdigest()[:16]
+
+def build_image_cache(samples, classes, size, num_workers=8):
+    cache_dir = IMAGE_CACHE_DIR / f'{image_cache_key(samples, size)}_{size}'
+    with key_lock(cache_dir):
+        if (cache_dir / 'index.json').exists():
+            return cache_dir
+
+        with atomic_directory(cache_dir) as tmp_dir:
+            images = np.lib.format.open_memmap(tmp_dir / 'images.npy', mode='w+', dtype=np.uint8, shape=(len(samples), size, size, 3))
+
+            with ThreadPoolExecutor(max_workers=num_workers) as executor:
+                for i, image in enumerate(executor.map(lambda sample: load_resized(sample[0], size), samples)):
+                    images[i] = image
+
+            images.flush()
+            del images
+            with open(tmp_dir / 'index.json', 'w') as f:
+                json.dump({'size': size, 'classes': classes, 'samples': [[str(path), target] for path, target in samples]}, f)
+    return cache_dir
+
+class CachedImageDataset(Dataset):
+    def __init__(self, cache_dir, transform=None):
+        self.cache_dir = cache_dir
+        self.transform = transform
+        with open(cache_dir / 'index.json') as f:
+            index = json.load(f)
+        self.classes = index['classes']
+        self.class_to_idx = {name: i for i, name in enumerate(self.classes)}
+        self.samples = [(path, target) for path, target in index['samples']]
+        self.targets = [target for _, target in self.samples]
+        self.images = None
+
+    def __len__(self):
+        return len(self.samples)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['images'] = None
+        return state
+
+    def __getitem__(self, index):
+        if self.images is None:
+            self.images = np.load(self.cache_dir / 'images.npy', mmap_mode='c')
+        sample = self.images[index]
+        if self.transform is not None:
+            sample = self.transform(image=sample)['image']
+        return sample, self.targets[index]
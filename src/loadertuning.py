@@ -0,0 +1,93 @@
+import argparse, json, os, socket, time, torch
+from itertools import islice
+from torch.utils.data import DataLoader
+from src.atomic import atomic_write
+from configs.paths import CACHE_DIR
+
+LOADER_CONFIG_PATH = CACHE_DIR / 'loader_config.json'
+
+def host_key():
+    return f'{socket.gethostname()}-{os.cpu_count()}cpu-{"cuda" if torch.cuda.is_available() else "cpu"}'
+
+def default_config():
+    return {'num_workers': min(8, os.cpu_count() or 1), 'prefetch_factor': 2, 'pin_memory': torch.cuda.is_available()}
+
+def loader_kwargs(config, persistent_workers=False):
+    if config['num_workers'] == 0:
+        return {'num_workers': 0, 'pin_memory': config['pin_memory']}
+    return {
+        'num_workers': config['num_workers'],
+        'prefetch_factor': config['prefetch_factor'],
+        'pin_memory': config['pin_memory'],
+        'persistent_workers': persistent_workers
+    }
+
+def measure_throughput(dataset, batch_size, config, batches=20, warmup_batches=3):
+    loader = DataLoader(dataset, batch_size=batch_size, shuffle=True, **loader_kwargs(config))
+    iterator = iter(loader)
+    try:
+        for _ in islice(iterator, warmup_batches):
+            pass
+        start = time.perf_counter()
+        measured = sum(1 for _ in islice(iterator, batches))
+        elapsed = time.perf_counter() - start
+    finally:
+        if hasattr(iterator, '_shutdown_workers'):
+            iterator._shutdown_workers()
+    return measured * batch_size / elapsed if elapsed else 0.0
+
+def tune_loader(dataset, batch_sizes=(64,), worker_candidates=None, prefetch_candidates=(2, 4), batches=20, verbose=True):
+    cpu_count = os.cpu_count() or 1
+    if worker_candidates is None:
+        worker_candidates = sorted({n for n in (0, 2, 4, cpu_count // 2, cpu_count) if n != 1 and n <= cpu_count})
+    pin_memory = torch.cuda.is_available()
+
+    best = None
+    for batch_size in batch_sizes:
+        for num_workers in worker_candidates:
+            for prefetch_factor in (prefetch_candidates if num_workers else (2,)):
+                config = {'num_workers': num_workers, 'prefetch_factor': prefetch_factor, 'pin_memory': pin_memory, 'batch_size': batch_size}
+                images_per_second = measure_throughput(dataset, batch_size, config, batches=min(batches, len(dataset) // batch_size or 1))
+                if verbose:
+                    print(f'batch_size={batch_size} num_workers={num_workers} prefetch_factor={prefetch_factor}: {images_per_second:.1f} images/s')
+                if best is None or images_per_second > best['images_per_second']:
+                    best = {**config, 'images_per_second': images_per_second}
+    return best
+
+def load_loader_configs():
+    if not LOADER_CONFIG_PATH.exists():
+        return {}
+    with open(LOADER_CONFIG_PATH) as f:
+        return json.load(f)
+
+def save_loader_config(name, config):
+    configs = load_loader_configs()
+    configs.setdefault(host_key(), {})[name] = config
+    with atomic_write(LOADER_CONFIG_PATH) as f:
+        json.dump(configs, f, indent=2)
+
+def get_loader_config(name, dataset=None, batch_size=64):
+    config = load_loader_configs().get(host_key(), {}).get(name)
+    if config is not None:
+        return config
+    if dataset is None:
+        return default_config()
+
+    print(f'Tuning DataLoader settings for {name} on {host_key()} (cached in {LOADER_CONFIG_PATH})')
+    config = tune_loader(dataset, batch_sizes=(batch_size,), verbose=False)
+    save_loader_config(name, config)
+    return config
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark DataLoader settings on this machine and cache the fastest one.')
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[32, 64])
+    parser.add_argument('--workers', type=int, nargs='+', default=None)
+    parser.add_argument('--prefetch-factors', type=int, nargs='+', default=[2, 4])
+    parser.add_argument('--batches', type=int, default=20)
+    args = parser.parse_args()
+
+    from src.dataloader import AlbumentationsDataset, build_train_transform
+    dataset = AlbumentationsDataset('train', transform=build_train_transform())
+    best = tune_loader(dataset, batch_sizes=args.batch_sizes, worker_candidates=args.workers, prefetch_candidates=args.prefetch_factors, batches=args.batches)
+    save_loader_config('train', best)
+    print(f'Best: {best}')
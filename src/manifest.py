@@ -0,0 +1,113 @@
+import hashlib, json, os
+from pathlib import Path
+from torchvision import datasets
+from sklearn.model_selection import train_test_split
+from src.atomic import atomic_write
+from configs.paths import RAW_DATA_DIR, MANIFEST_PATH, TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR
+
+CLASSES = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
+SPLITS = ('train', 'validation', 'test')
+
+def file_digest(path):
+    with open(path, 'rb') as f:
+        return hashlib.file_digest(f, 'sha1').hexdigest()
+
+def hash_split(digest, test_size, val_size):
+    bucket = int(digest[:8], 16) / 0xFFFFFFFF
+    if bucket < test_size:
+        return 'test'
+    if bucket < test_size + val_size:
+        return 'validation'
+    return 'train'
+
+def legacy_split(class_name, file_name):
+    # Splits made before the manifest were copied into data/train|validation|test.
+    for split, split_dir in zip(SPLITS, (TRAIN_DATA_DIR, VAL_DATA_DIR, TEST_DATA_DIR)):
+        if (split_dir / class_name / file_name).exists():
+            return split
+    return None
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    if not Path(manifest_path).exists():
+        return {'classes': CLASSES, 'entries': []}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+def save_manifest(manifest, manifest_path=MANIFEST_PATH):
+    with atomic_write(manifest_path) as f:
+        json.dump(manifest, f, indent=1)
+
+def split_dataset(raw_dir: Path = RAW_DATA_DIR, test_size=0.1, val_size=0.1, manifest_path=MANIFEST_PATH):
+    manifest = load_manifest(manifest_path)
+    previous = {entry['path']: entry for entry in manifest['entries']}
+    entries = []
+    changed = False
+
+    for _class in CLASSES:
+        CLASS_DIR = raw_dir / _class
+        images = list(CLASS_DIR.glob('*.jpg')) + list(CLASS_DIR.glob('*.png'))
+        new_images = []
+
+        for image in images:
+            path = image.relative_to(raw_dir).as_posix()
+            stat = image.stat()
+            entry = previous.get(path)
+            if entry is not None and entry['size'] == stat.st_size and entry['mtime_ns'] == stat.st_mtime_ns:
+                entries.append(entry)
+                continue
+
+            changed = True
+            digest = file_digest(image)
+            if entry is not None:
+                entries.append({**entry, 'sha1': digest, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+            else:
+                new_images.append({'path': path, 'sha1': digest, 'class': _class, 'split': None, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns})
+
+        if not new_images:
+            continue
+
+        # Files copied into the pre-manifest split folders keep that split; only the rest are assigned here.
+        unassigned = []
+        for entry in new_images:
+            entry['split'] = legacy_split(_class, Path(entry['path']).name)
+            if entry['split'] is None:
+                unassigned.append(entry)
+
+        if len(unassigned) < len(new_images) or any(entry['class'] == _class for entry in previous.values()) or len(unassigned) < 10:
+            for entry in unassigned:
+                entry['split'] = hash_split(entry['sha1'], test_size, val_size)
+        elif unassigned:
+            unassigned.sort(key=lambda entry: entry['path'])
+            train_val, test = train_test_split(unassigned, test_size=test_size, random_state=42)
+            train, validation = train_test_split(train_val, test_size=val_size / (1 - test_size), random_state=42)
+            for split, split_entries in zip(SPLITS, [train, validation, test]):
+                for entry in split_entries:
+                    entry['split'] = split
+        entries.extend(new_images)
+
+    if changed or len(entries) != len(previous):
+        manifest = {'raw_dir': str(Path(raw_dir).resolve()), 'classes': CLASSES, 'test_size': test_size, 'val_size': val_size, 'entries': entries}
+        save_manifest(manifest, manifest_path)
+    return manifest
+
+class ManifestImageFolder(datasets.ImageFolder):
+    def __init__(self, split, transform=None, raw_dir=None, manifest_path=MANIFEST_PATH):
+        if split not in SPLITS:
+            raise ValueError(f'Unknown split {split!r}, expected one of {SPLITS}')
+        self.split = split
+        if Path(manifest_path).exists():
+            self.manifest = load_manifest(manifest_path)
+        else:
+            self.manifest = split_dataset(Path(raw_dir or RAW_DATA_DIR), manifest_path=manifest_path)
+        # Entry paths are relative to the directory the manifest was built from.
+        manifest_dir = Path(self.manifest.get('raw_dir', RAW_DATA_DIR))
+        if raw_dir is not None and Path(raw_dir).resolve() != manifest_dir.resolve():
+            raise ValueError(f'{manifest_path} was built from {manifest_dir}, not {raw_dir}')
+        super().__init__(manifest_dir, transform=transform)
+
+    def find_classes(self, directory):
+        classes = self.manifest['classes']
+        return classes, {name: i for i, name in enumerate(classes)}
+
+    def make_dataset(self, directory, class_to_idx, extensions=None, is_valid_file=None, allow_empty=False):
+        return [(os.path.join(directory, entry['path']), class_to_idx[entry['class']]) for entry in self.manifest['entries'] if entry['split'] == self.split]
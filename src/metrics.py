@@ -0,0 +1,63 @@
+import json, torch
+from src.atomic import atomic_write
+
+class StreamingMetrics:
+    def __init__(self, num_classes, device, top_k=(1, 3), calibration_bins=15):
+        self.num_classes = num_classes
+        self.top_k = tuple(k for k in top_k if k <= num_classes)
+        self.calibration_bins = calibration_bins
+        self.confusion = torch.zeros(num_classes * num_classes, dtype=torch.long, device=device)
+        self.top_k_correct = torch.zeros(len(self.top_k), dtype=torch.long, device=device)
+        self.bin_counts = torch.zeros(calibration_bins, dtype=torch.long, device=device)
+        self.bin_confidence = torch.zeros(calibration_bins, device=device)
+        self.bin_correct = torch.zeros(calibration_bins, device=device)
+        self.seconds = 0.0
+
+    def update(self, probabilities, labels):
+        probabilities = probabilities.float()
+        confidence, predicted = probabilities.max(1)
+        correct = predicted == labels
+        self.confusion += torch.bincount(labels * self.num_classes + predicted, minlength=self.num_classes ** 2)
+
+        if self.top_k:
+            hits = probabilities.topk(max(self.top_k), dim=1).indices == labels[:, None]
+            self.top_k_correct += torch.stack([hits[:, :k].any(1).sum() for k in self.top_k])
+
+        bins = (confidence * self.calibration_bins).long().clamp(max=self.calibration_bins - 1)
+        self.bin_counts += torch.bincount(bins, minlength=self.calibration_bins)
+        self.bin_confidence += torch.bincount(bins, weights=confidence, minlength=self.calibration_bins)
+        self.bin_correct += torch.bincount(bins, weights=correct.float(), minlength=self.calibration_bins)
+
+    def compute(self, classes=None):
+        classes = classes or [str(i) for i in range(self.num_classes)]
+        confusion = self.confusion.view(self.num_classes, self.num_classes).double()
+        true_positives = confusion.diagonal()
+        support = confusion.sum(1)
+        precision = true_positives / confusion.sum(0).clamp(min=1)
+        recall = true_positives / support.clamp(min=1)
+        f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+        total = support.sum().clamp(min=1)
+        calibration_gap = (self.bin_correct.double() - self.bin_confidence.double()).abs().sum()
+
+        confusion, precision, recall, f1, support, top_k_correct, calibration_gap, total = (
+            value.tolist() for value in (confusion, precision, recall, f1, support, self.top_k_correct, calibration_gap, total)
+        )
+        return {
+            'images': int(sum(support)),
+            'accuracy': 100 * sum(confusion[i][i] for i in range(self.num_classes)) / total,
+            'top_k_accuracy': {f'top{k}': 100 * correct / total for k, correct in zip(self.top_k, top_k_correct)},
+            'macro_precision': sum(precision) / self.num_classes,
+            'macro_recall': sum(recall) / self.num_classes,
+            'macro_f1': sum(f1) / self.num_classes,
+            'expected_calibration_error': calibration_gap / total,
+            'per_class': {
+                name: {'precision': precision[i], 'recall': recall[i], 'f1': f1[i], 'support': int(support[i])}
+                for i, name in enumerate(classes)
+            },
+            'confusion_matrix': [[int(count) for count in row] for row in confusion],
+            'ms_per_image': 1000 * self.seconds / total
+        }
+
+def save_report(report, path):
+    with atomic_write(path) as f:
+        json.dump(report, f, indent=2)
@@ -1,5 +1,35 @@
-import timm
+import timm, torch
+from itertools import chain
+from pathlib import Path
+
+# Short names for the two trained architectures: densenet201 from src.train and MobileNetV4 from src.trainOptuna.
+MODEL_NAMES = {'densenet201': 'densenet201', 'mobilenetv4': 'mobilenetv4_hybrid_medium.e500_r224_in1k'}
 
 def get_model(model_name='densenet201', num_classes=6, pretrained=True):
     model = timm.create_model(model_name, pretrained=pretrained, num_classes=num_classes)
-    return model
\ No newline at end of file
+    return model
+
+def load_state_dict(checkpoint_path, device='cpu'):
+    checkpoint_path = Path(checkpoint_path)
+    if checkpoint_path.suffix == '.safetensors':
+        from safetensors.torch import load_file
+        return load_file(checkpoint_path, device=str(device))
+    return torch.load(checkpoint_path, map_location=device, weights_only=True, mmap=True)
+
+def build_model_from_state_dict(state_dict, model_name='densenet201', num_classes=6):
+    with torch.device('meta'):
+        model = get_model(model_name=model_name, num_classes=num_classes, pretrained=False)
+    model.load_state_dict(state_dict, assign=True)
+
+    if any(tensor.is_meta for tensor in chain(model.parameters(), model.buffers())):
+        model = get_model(model_name=model_name, num_classes=num_classes, pretrained=False)
+        model.load_state_dict(state_dict)
+    return model
+
+def load_inference_model(checkpoint_path, model_name='densenet201', num_classes=6, device='cpu'):
+    device = torch.device(device)
+    state_dict = load_state_dict(checkpoint_path, device=device)
+    model = build_model_from_state_dict(state_dict, model_name=model_name, num_classes=num_classes)
+    model.to(device)
+    model.eval()
+    return model
@@ -0,0 +1,33 @@
+import torch
+from contextlib import nullcontext
+
+PRECISIONS = ('fp32', 'bf16', 'fp16')
+DTYPES = {'bf16': torch.bfloat16, 'fp16': torch.float16}
+
+def resolve_precision(precision, device):
+    if precision not in PRECISIONS:
+        raise ValueError(f'Unknown precision {precision!r}, expected one of {PRECISIONS}')
+    if precision == 'fp16' and device.type != 'cuda':
+        return 'bf16'
+    if precision == 'bf16' and device.type == 'cuda' and not torch.cuda.is_bf16_supported():
+        return 'fp16'
+    return precision
+
+def autocast(device, precision):
+    if precision == 'fp32':
+        return nullcontext()
+    return torch.autocast(device_type=device.type, dtype=DTYPES[precision])
+
+def make_grad_scaler(device, precision):
+    return torch.amp.GradScaler(device.type, enabled=(precision == 'fp16'))
+
+def to_device(imgs, device, channels_last=False):
+    if channels_last:
+        return imgs.to(device, memory_format=torch.channels_last, non_blocking=True)
+    return imgs.to(device, non_blocking=True)
+
+def prepare_model(model, device, channels_last=False):
+    model = model.to(device)
+    if channels_last:
+        model = model.to(memory_format=torch.channels_last)
+    return model
@@ -0,0 +1,71 @@
+import argparse, csv, glob, time
+from pathlib import Path
+from src.predictor import IMAGE_EXTENSIONS, get_predictor
+from src.backends import BACKENDS
+from configs.paths import MODELS_DIR
+
+def collect_image_paths(inputs):
+    for item in inputs:
+        path = Path(item)
+        if path.is_dir():
+            yield from sorted(p for p in path.rglob('*') if p.suffix.lower() in IMAGE_EXTENSIONS)
+        elif path.is_file():
+            yield path
+        else:
+            yield from sorted(Path(p) for p in glob.glob(item, recursive=True) if Path(p).suffix.lower() in IMAGE_EXTENSIONS)
+
+def classify_batch(inputs, out_path, checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), model_name='densenet201', image_size=224, batch_size=32, num_workers=4, top_k=3, backend=None, compile=False):
+    predictor = get_predictor(checkpoint_path=checkpoint_path, model_name=model_name, image_size=image_size, backend=backend, compile=compile)
+    predictor.warm_up()
+
+    classified = 0
+    failed = 0
+    start = time.perf_counter()
+
+    with open(out_path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['path', 'predicted_class', 'confidence', 'top_k', 'error'])
+
+        for prediction in predictor.predict_paths(collect_image_paths(inputs), batch_size=batch_size, num_workers=num_workers, top_k=top_k):
+            if prediction.error is not None:
+                failed += 1
+                writer.writerow([prediction.path, '', '', '', prediction.error])
+                continue
+
+            classified += 1
+            top = ';'.join(f'{name}:{confidence:.4f}' for name, confidence in prediction.top_k)
+            writer.writerow([prediction.path, prediction.predicted_class, f'{prediction.confidence:.4f}', top, ''])
+            if classified % batch_size == 0:
+                f.flush()
+
+    elapsed = time.perf_counter() - start
+    print(f'Classified {classified} images ({failed} failed) in {elapsed:.2f}s: {classified / elapsed if elapsed else 0:.2f} images/s')
+    print(f'Results written to {out_path}')
+    return classified, failed, elapsed
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Classify every image in one or more folders, files or glob patterns.')
+    parser.add_argument('inputs', nargs='+', help='Image directories, files or glob patterns')
+    parser.add_argument('--out', default='results.csv')
+    parser.add_argument('--checkpoint', default=str(MODELS_DIR / 'stage2_best.pth'), help='e.g. models/stage2_best.int8.pt for the quantized model')
+    parser.add_argument('--backend', choices=BACKENDS, default=None, help='Defaults to the one matching the checkpoint file extension')
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--workers', type=int, default=4, help='Number of image decoding threads')
+    parser.add_argument('--top-k', type=int, default=3)
+    parser.add_argument('--compile', action='store_true', help='Run the PyTorch model through torch.compile (cached on disk in .cache/torch_compile)')
+    args = parser.parse_args()
+
+    classify_batch(
+        args.inputs,
+        args.out,
+        checkpoint_path=args.checkpoint,
+        model_name=args.model_name,
+        image_size=args.image_size,
+        batch_size=args.batch_size,
+        num_workers=args.workers,
+        top_k=args.top_k,
+        backend=args.backend,
+        compile=args.compile
+    )
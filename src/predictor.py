@@ -0,0 +1,137 @@
+import os, threading
+import torch
+from collections import OrderedDict, deque, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+from pathlib import Path
+from PIL import Image
+from src.backends import CPU_BACKENDS, load_backend_model, infer_backend
+from src.tta import predict_tta
+from configs.paths import MODELS_DIR
+from configs.training import COMPILE_BACKEND, COMPILE_MODE
+
+CLASSES = ['cardboard', 'glass', 'metal', 'paper', 'plastic', 'trash']
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png')
+
+Prediction = namedtuple('Prediction', ['path', 'predicted_class', 'confidence', 'top_k', 'error'])
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+def default_device():
+    return torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+
+class ModelRegistry:
+    def __init__(self, max_models=2):
+        self.max_models = max_models
+        self._models = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, checkpoint_path, model_name='densenet201', device=None, num_classes=6, backend=None, compile=False):
+        checkpoint_path = Path(checkpoint_path).resolve()
+        device = torch.device(device) if device is not None else default_device()
+        backend = backend or infer_backend(checkpoint_path)
+        compile = compile and backend == 'torch'
+        key = (str(checkpoint_path), model_name, str(device), backend, compile)
+        mtime = os.path.getmtime(checkpoint_path)
+
+        with self._lock:
+            entry = self._models.get(key)
+            if entry is not None and entry[0] == mtime:
+                self._models.move_to_end(key)
+                return entry[1]
+
+            self._models.pop(key, None)
+            model = load_backend_model(checkpoint_path, model_name=model_name, num_classes=num_classes, device=device, backend=backend)
+            if compile:
+                from src.compilation import compile_model
+                model = compile_model(model, backend=COMPILE_BACKEND, mode=COMPILE_MODE, cache_name=f'{model_name}-inference', device=device)
+
+            self._models[key] = (mtime, model)
+            while len(self._models) > self.max_models:
+                self._models.popitem(last=False)
+            return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+registry = ModelRegistry()
+
+class Predictor:
+    def __init__(self, checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), model_name='densenet201', device=None, image_size=224, registry=registry, tta_views=1, backend=None, compile=False):
+        self.checkpoint_path = checkpoint_path
+        self.model_name = model_name
+        self.backend = backend or infer_backend(checkpoint_path)
+        if device is None and self.backend in CPU_BACKENDS:
+            device = 'cpu'
+        self.device = torch.device(device) if device is not None else default_device()
+        self.image_size = image_size
+        self.tta_views = tta_views
+        self.compile = compile
+        self.registry = registry
+        self.mean = torch.tensor([0.485, 0.456, 0.406]).view(3, 1, 1)
+        self.std = torch.tensor([0.229, 0.224, 0.225]).view(3, 1, 1)
+
+    @property
+    def model(self):
+        return self.registry.get(self.checkpoint_path, model_name=self.model_name, device=self.device, num_classes=len(CLASSES), backend=self.backend, compile=self.compile)
+
+    def warm_up(self):
+        with torch.no_grad():
+            self.model(torch.zeros(1, 3, self.image_size, self.image_size, device=self.device))
+        if self.compile:
+            from src.compilation import is_compiled, save_compile_artifacts
+            if is_compiled(self.model):
+                save_compile_artifacts(f'{self.model_name}-inference', self.device)
+
+    def preprocess(self, image_path):
+        image = Image.open(image_path).convert('RGB').resize((self.image_size, self.image_size), Image.Resampling.BILINEAR)
+        image_tensor = torch.frombuffer(bytearray(image.tobytes()), dtype=torch.uint8).view(self.image_size, self.image_size, 3)
+        image_tensor = image_tensor.permute(2, 0, 1).float().div(255)
+        return (image_tensor - self.mean) / self.std
+
+    def predict_tensors(self, image_tensors):
+        with torch.no_grad():
+            return predict_tta(self.model, image_tensors.to(self.device), self.tta_views).cpu()
+
+    def predict(self, image_path):
+        probabilities = self.predict_tensors(self.preprocess(image_path).unsqueeze(0))
+        confidence, predicted = torch.max(probabilities, 1)
+        return CLASSES[predicted.item()], confidence.item()
+
+    def predict_paths(self, image_paths, batch_size=32, num_workers=4, top_k=3, prefetch_batches=2):
+        top_k = min(top_k, len(CLASSES))
+        batches = batched(image_paths, batch_size)
+
+        with ThreadPoolExecutor(max_workers=num_workers) as executor:
+            pending = deque()
+            for batch_paths in islice(batches, prefetch_batches):
+                pending.append((batch_paths, [executor.submit(self.preprocess, path) for path in batch_paths]))
+
+            while pending:
+                batch_paths, futures = pending.popleft()
+                next_paths = next(batches, None)
+                if next_paths is not None:
+                    pending.append((next_paths, [executor.submit(self.preprocess, path) for path in next_paths]))
+
+                decoded_paths, image_tensors = [], []
+                for path, future in zip(batch_paths, futures):
+                    try:
+                        image_tensors.append(future.result())
+                        decoded_paths.append(path)
+                    except Exception as e:
+                        yield Prediction(path, None, None, [], str(e))
+
+                if not image_tensors:
+                    continue
+
+                confidences, indices = self.predict_tensors(torch.stack(image_tensors)).topk(top_k, dim=1)
+                for path, confidence_row, index_row in zip(decoded_paths, confidences.tolist(), indices.tolist()):
+                    top = [(CLASSES[index], confidence) for index, confidence in zip(index_row, confidence_row)]
+                    yield Prediction(path, top[0][0], top[0][1], top, None)
+
+def get_predictor(checkpoint_path=(MODELS_DIR / 'stage2_best.pth'), model_name='densenet201', device=None, image_size=224, tta_views=1, backend=None, compile=False):
+    return Predictor(checkpoint_path=checkpoint_path, model_name=model_name, device=device, image_size=image_size, tta_views=tta_views, backend=backend, compile=compile)
@@ -0,0 +1,79 @@
+import argparse, platform, torch
+from itertools import islice
+from pathlib import Path
+from torch.ao.quantization import get_default_qconfig_mapping, quantize_dynamic
+from torch.ao.quantization.quantize_fx import prepare_fx, convert_fx
+from src.model import load_inference_model
+from src.dataloader import get_eval_loader
+from src.evaluate import evaluate_test_set
+from src.export import single_image_latency
+from src.atomic import atomic_path
+from configs.paths import MODELS_DIR
+
+QUANTIZATION_MODES = ('static', 'dynamic')
+
+def quantization_engine():
+    return 'qnnpack' if platform.machine().lower() in ('arm64', 'aarch64') else 'x86'
+
+def quantize_static(model, calibration_loader, calibration_batches=20):
+    engine = quantization_engine()
+    torch.backends.quantized.engine = engine
+    example_inputs = (next(iter(calibration_loader))[0],)
+    prepared = prepare_fx(model, get_default_qconfig_mapping(engine), example_inputs=example_inputs)
+    with torch.no_grad():
+        for imgs, _ in islice(calibration_loader, calibration_batches):
+            prepared(imgs)
+    return convert_fx(prepared)
+
+def quantize_dynamic_linear(model):
+    return quantize_dynamic(model, {torch.nn.Linear}, dtype=torch.qint8)
+
+def save_quantized(model, path, image_size=224):
+    with torch.no_grad():
+        traced = torch.jit.freeze(torch.jit.trace(model, torch.randn(1, 3, image_size, image_size)))
+    with atomic_path(path) as tmp_path:
+        traced.save(str(tmp_path))
+    return path
+
+def quantize_checkpoint(checkpoint_path, model_name='densenet201', mode='static', calibration_batches=20, batch_size=32, image_size=224, out_path=None):
+    checkpoint_path = Path(checkpoint_path)
+    out_path = Path(out_path) if out_path is not None else checkpoint_path.with_name(f'{checkpoint_path.stem}.int8.pt')
+    model = load_inference_model(checkpoint_path, model_name=model_name, device='cpu')
+
+    if mode == 'static':
+        validation_loader = get_eval_loader('validation', batch_size=batch_size, image_size=image_size)
+        quantized = quantize_static(model, validation_loader, calibration_batches)
+    elif mode == 'dynamic':
+        quantized = quantize_dynamic_linear(model)
+    else:
+        raise ValueError(f'Unknown quantization mode {mode!r}, expected one of {QUANTIZATION_MODES}')
+
+    print(f'fp32: {single_image_latency(model, image_size) * 1000:.1f} ms/image on CPU')
+    print(f'int8 ({mode}): {single_image_latency(quantized, image_size) * 1000:.1f} ms/image on CPU')
+    return save_quantized(quantized, out_path, image_size)
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Quantize a trained checkpoint to int8 for CPU inference and compare its test accuracy with the fp32 model.')
+    parser.add_argument('--checkpoint', default=str(MODELS_DIR / 'stage2_best.pth'))
+    parser.add_argument('--model-name', default='densenet201')
+    parser.add_argument('--mode', choices=QUANTIZATION_MODES, default='static', help='static quantizes every layer using calibration on the validation set, dynamic only the linear layers')
+    parser.add_argument('--calibration-batches', type=int, default=20)
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--image-size', type=int, default=224)
+    parser.add_argument('--out', default=None, help='Defaults to <checkpoint>.int8.pt next to the checkpoint')
+    args = parser.parse_args()
+
+    out_path = quantize_checkpoint(
+        args.checkpoint,
+        model_name=args.model_name,
+        mode=args.mode,
+        calibration_batches=args.calibration_batches,
+        batch_size=args.batch_size,
+        image_size=args.image_size,
+        out_path=args.out
+    )
+    print(f'Quantized model written to {out_path}')
+
+    fp32_accuracy = evaluate_test_set(args.checkpoint, model_name=args.model_name, backend='torch', plot=False, report_path=None)
+    int8_accuracy = evaluate_test_set(out_path, backend='int8', plot=False, report_path=None)
+    print(f'Accuracy delta (int8 - fp32): {int8_accuracy - fp32_accuracy:+.2f} percentage points')
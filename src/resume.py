@@ -0,0 +1,144 @@
+import math, queue, random, threading, torch
+import numpy as np
+from torch.utils.data import Sampler
+from src.trainer import Callback, save_checkpoint
+
+class ResumableRandomSampler(Sampler):
+    def __init__(self, data_source, seed=42, num_replicas=1, rank=0):
+        self.data_source = data_source
+        self.seed = seed
+        self.num_replicas = num_replicas
+        self.rank = rank
+        self.epoch = 0
+        self.start_index = 0
+
+    def set_epoch(self, epoch):
+        self.epoch = epoch
+
+    def __len__(self):
+        return math.ceil(len(self.data_source) / self.num_replicas) - self.start_index
+
+    def __iter__(self):
+        generator = torch.Generator().manual_seed(self.seed + self.epoch)
+        indices = torch.randperm(len(self.data_source), generator=generator).tolist()
+        padded = math.ceil(len(indices) / self.num_replicas) * self.num_replicas
+        indices = (indices + indices[:padded - len(indices)])[self.rank::self.num_replicas]
+        start_index, self.start_index = self.start_index, 0
+        yield from indices[start_index:]
+
+    def state_dict(self):
+        return {'seed': self.seed, 'epoch': self.epoch}
+
+    def load_state_dict(self, state, start_index=0):
+        self.seed = state['seed']
+        self.epoch = state['epoch']
+        self.start_index = start_index
+
+def snapshot(obj):
+    if isinstance(obj, torch.Tensor):
+        return obj.detach().to('cpu', copy=True)
+    if isinstance(obj, dict):
+        return {key: snapshot(value) for key, value in obj.items()}
+    if isinstance(obj, (list, tuple)):
+        return type(obj)(snapshot(value) for value in obj)
+    return obj
+
+def rng_state():
+    return {
+        'python': random.getstate(),
+        'numpy': np.random.get_state(),
+        'torch': torch.get_rng_state(),
+        'cuda': torch.cuda.get_rng_state_all() if torch.cuda.is_available() else []
+    }
+
+def set_rng_state(state):
+    random.setstate(state['python'])
+    np.random.set_state(state['numpy'])
+    torch.set_rng_state(state['torch'])
+    if state['cuda'] and torch.cuda.is_available():
+        torch.cuda.set_rng_state_all(state['cuda'])
+
+class AsyncCheckpointWriter:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=1)
+        self.error = None
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                break
+            state, path = item
+            try:
+                save_checkpoint(state, path)
+            except Exception as e:
+                self.error = e
+
+    def save(self, state, path):
+        if self.error is not None:
+            raise self.error
+        self.queue.put((snapshot(state), path))
+
+    def close(self):
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+class TrainingCheckpoint(Callback):
+    def __init__(self, model, path, writer, best_checkpoint=None, every_batches=200):
+        self.model = model
+        self.path = path
+        self.writer = writer
+        self.best_checkpoint = best_checkpoint
+        self.every_batches = every_batches
+
+    def save(self, trainer, epoch, batches, train_loss):
+        sampler = trainer.train_loader.sampler
+        state = {
+            'stage': trainer.stage,
+            'epoch': epoch,
+            'batch': batches,
+            'train_loss': train_loss,
+            'model': self.model.state_dict(),
+            'optimizer': trainer.optimizer.state_dict(),
+            'scheduler': trainer.scheduler.state_dict(),
+            'scaler': trainer.scaler.state_dict(),
+            'best_validation_loss': self.best_checkpoint.best_validation_loss if self.best_checkpoint is not None else None,
+            'sampler': sampler.state_dict() if isinstance(sampler, ResumableRandomSampler) else None,
+            'rng': rng_state()
+        }
+        self.writer.save(state, self.path)
+
+    def on_batch_end(self, trainer, batch):
+        # Gradients of a partial accumulation cycle are not saved, so wait for the next optimizer step.
+        due = batch % self.every_batches < trainer.accumulation_steps if self.every_batches else False
+        if due and trainer.accumulated == 0 and isinstance(trainer.train_loader.sampler, ResumableRandomSampler):
+            self.save(trainer, trainer.epoch, batch, trainer.train_loss.item())
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        self.save(trainer, epoch + 1, 0, 0.0)
+
+def load_training_state(path, model, best_checkpoint=None):
+    state = torch.load(path, map_location='cpu', weights_only=False)
+    model.load_state_dict(state['model'])
+    if best_checkpoint is not None and state['best_validation_loss'] is not None:
+        best_checkpoint.best_validation_loss = state['best_validation_loss']
+    return state
+
+def resume_fit_kwargs(state, stage, optimizer, scheduler, scaler, train_loader):
+    if state is None or state['stage'] != stage:
+        return {}
+    set_rng_state(state['rng'])
+    optimizer.load_state_dict(state['optimizer'])
+    scheduler.load_state_dict(state['scheduler'])
+    if state['scaler']:
+        scaler.load_state_dict(state['scaler'])
+
+    start_batch = 0
+    if state['batch'] and state['sampler'] is not None and isinstance(train_loader.sampler, ResumableRandomSampler):
+        start_batch = state['batch']
+        train_loader.sampler.load_state_dict(state['sampler'], start_index=start_batch * train_loader.batch_size)
+    return {'start_epoch': state['epoch'], 'start_batch': start_batch, 'start_loss': state['train_loss'] if start_batch else 0.0}
@@ -1,123 +1,112 @@
-import torch
+import argparse, math, torch
 import torch.optim as optim
 from src.model import get_model
 from src.dataloader import split_dataset, get_dataloaders
 from torch.utils.tensorboard import SummaryWriter
-from configs.paths import LOGS_DIR, MODELS_DIR
+from src.features import get_feature_loaders
+from src.batchaugment import BatchAugmentation
+from src.compilation import compile_model, CompileCache
+from src.batchsize import find_max_batch_size, plan_batches
+from src.precision import resolve_precision, prepare_model, make_grad_scaler
+from src.trainer import Trainer, ProgressPrinter, TensorBoardLogger, BestCheckpoint
+from src.resume import AsyncCheckpointWriter, TrainingCheckpoint, load_training_state, resume_fit_kwargs
+from src.distributed import init_distributed, cleanup_distributed, is_distributed, is_main_process, get_world_size, main_process_first, wrap_model
+from configs.paths import LOGS_DIR, MODELS_DIR, TRAINING_STATE_PATH
+from configs.training import PRECISION, CHANNELS_LAST, STAGE1_FEATURE_CACHE, STAGE1_AUGMENTATIONS, IMAGE_CACHE, IMAGE_CACHE_SIZE, AUGMENTATION_BACKEND, COMPILE, COMPILE_BACKEND, COMPILE_MODE, EFFECTIVE_BATCH_SIZE, AUTO_BATCH_SIZE
+
+def prepare_training_model(model, device):
+    model = wrap_model(model, device)
+    if COMPILE:
+        model = compile_model(model, backend=COMPILE_BACKEND, mode=COMPILE_MODE, cache_name='densenet201-train', device=device)
+    return model
 
 if __name__ == '__main__':
-    split_dataset()
+    parser = argparse.ArgumentParser(description='Train the DenseNet201 waste classifier. Launch with torchrun --nproc-per-node N for data-parallel training.')
+    parser.add_argument('--resume', action='store_true', help=f'Continue from the last full-state checkpoint in {TRAINING_STATE_PATH}')
+    parser.add_argument('--checkpoint-every', type=int, default=200, help='Batches between mid-epoch full-state checkpoints, 0 to save only at the end of every epoch')
+    parser.add_argument('--batch-size', type=int, default=EFFECTIVE_BATCH_SIZE, help='Effective batch size per optimizer step, summed over all processes')
+    parser.add_argument('--auto-batch-size', action='store_true', default=AUTO_BATCH_SIZE, help='Train on the largest batch that fits in memory and accumulate gradients to reach --batch-size')
+    parser.add_argument('--dist-backend', default='gloo', help='torch.distributed backend used when launched with torchrun')
+    args = parser.parse_args()
+
+    device = init_distributed(args.dist_backend)
+    distributed = is_distributed()
 
     stage1_epochs = 20
     stage2_epochs = 30
 
-    device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = get_model(model_name='densenet201', num_classes=6, pretrained=True).to(device)
-
-    train_loader, validation_loader, _ = get_dataloaders()
-    writer = SummaryWriter(LOGS_DIR)
+    precision = resolve_precision(PRECISION, device)
+    channels_last = CHANNELS_LAST
+    model = prepare_model(get_model(model_name='densenet201', num_classes=6, pretrained=True), device, channels_last)
+
+    batch_size, accumulation_steps = math.ceil(args.batch_size / get_world_size()), 1
+    with main_process_first():
+        if args.auto_batch_size:
+            max_batch_size = find_max_batch_size(model, device, 'densenet201', precision=precision, channels_last=channels_last)
+            batch_size, accumulation_steps = plan_batches(batch_size, max_batch_size)
+            if is_main_process():
+                print(f'Training on batches of {batch_size} with {accumulation_steps} accumulation steps (max batch size {max_batch_size})')
+        split_dataset()
+        train_loader, validation_loader, _ = get_dataloaders(batch_size=batch_size, use_cache=IMAGE_CACHE, cache_size=IMAGE_CACHE_SIZE, augmentation_backend=AUGMENTATION_BACKEND, resumable=True, distributed=distributed)
+    batch_transform = BatchAugmentation() if AUGMENTATION_BACKEND == 'batch' else None
 
     criterion = torch.nn.CrossEntropyLoss()
-    best_validation_loss = float('inf')
-
-    for param in model.parameters():
-        param.requires_grad = False
-    for param in model.get_classifier().parameters():
-        param.requires_grad = True
-
-    optimizer = optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=0.001, weight_decay=0.0001)
-    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
-
-    for epoch in range(stage1_epochs):
-        model.train()
-        train_loss = 0.0
-
-        for imgs, labels in train_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            train_loss += loss.item()
-
-        model.eval()
-        validation_loss = 0.0
-        correct = 0
-        total = 0
-
-        with torch.no_grad():
-            for imgs, labels in validation_loader:
-                imgs, labels = imgs.to(device), labels.to(device)
-                outputs = model(imgs)
-                loss = criterion(outputs, labels)
-                validation_loss += loss.item()
-                _, predicted = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-
-        average_validation_loss = validation_loss / len(validation_loader)
-        average_train_loss = train_loss / len(train_loader)
-        validation_accuracy = 100 * correct / total
-        scheduler.step(average_validation_loss)
-
-        writer.add_scalar('Loss/train_stage1', average_train_loss, epoch)
-        writer.add_scalar('Loss/validation_stage1', average_validation_loss, epoch)
-        writer.add_scalar('Accuracy/validation_stage1', validation_accuracy, epoch)
-
-        print(f'[STAGE 1] Epoch {epoch+1}/{stage1_epochs}: Train Loss: {average_train_loss:.4f}, Validation Loss: {average_validation_loss:.4f}, Validation Accuracy: {validation_accuracy:.2f}%')
-
-        if average_validation_loss < best_validation_loss:
-            best_validation_loss = average_validation_loss
-            torch.save(model.state_dict(), (MODELS_DIR / f'stage1_best.pth'))
+    best_checkpoint = BestCheckpoint(model, MODELS_DIR)
+    callbacks = []
+    if is_main_process():
+        writer = SummaryWriter(LOGS_DIR)
+        checkpoint_writer = AsyncCheckpointWriter()
+        callbacks = [TensorBoardLogger(writer), ProgressPrinter(), best_checkpoint, TrainingCheckpoint(model, TRAINING_STATE_PATH, checkpoint_writer, best_checkpoint, args.checkpoint_every)]
+        if COMPILE:
+            callbacks.append(CompileCache('densenet201-train', device))
+
+    resume_state = None
+    if args.resume and TRAINING_STATE_PATH.exists():
+        resume_state = load_training_state(TRAINING_STATE_PATH, model, best_checkpoint)
+        if is_main_process():
+            print(f'Resuming stage {resume_state["stage"]} at epoch {resume_state["epoch"] + 1}, batch {resume_state["batch"]}')
+
+    if resume_state is None or resume_state['stage'] == 1:
+        for param in model.parameters():
+            param.requires_grad = False
+        for param in model.get_classifier().parameters():
+            param.requires_grad = True
+
+        if STAGE1_FEATURE_CACHE:
+            with main_process_first():
+                stage1_train_loader, stage1_validation_loader = get_feature_loaders(
+                    model,
+                    train_loader.dataset,
+                    validation_loader.dataset,
+                    device,
+                    augmentations=STAGE1_AUGMENTATIONS,
+                    batch_size=train_loader.batch_size,
+                    precision=precision,
+                    batch_transform=batch_transform,
+                    distributed=distributed
+                )
+            stage1_trainer = Trainer(wrap_model(model.get_classifier(), device), criterion, device, precision=precision, callbacks=callbacks, accumulation_steps=accumulation_steps)
+        else:
+            stage1_train_loader, stage1_validation_loader = train_loader, validation_loader
+            stage1_trainer = Trainer(prepare_training_model(model, device), criterion, device, precision=precision, channels_last=channels_last, callbacks=callbacks, batch_transform=batch_transform, accumulation_steps=accumulation_steps)
+
+        optimizer = optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=0.001, weight_decay=0.0001)
+        scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
+        scaler = make_grad_scaler(device, precision)
+        resume = resume_fit_kwargs(resume_state, 1, optimizer, scheduler, scaler, stage1_train_loader)
+        stage1_trainer.fit(stage1_train_loader, stage1_validation_loader, optimizer, scheduler, stage1_epochs, stage=1, scaler=scaler, **resume)
 
     for param in model.parameters():
         param.requires_grad = True
 
     optimizer = optim.AdamW(model.parameters(), lr=0.00001, weight_decay=0.0001)
     scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
-
-    for epoch in range(stage2_epochs):
-        model.train()
-        train_loss = 0.0
-
-        for imgs, labels in train_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            train_loss += loss.item()
-
-        model.eval()
-        validation_loss = 0.0
-        correct = 0
-        total = 0
-
-        with torch.no_grad():
-            for imgs, labels in validation_loader:
-                imgs, labels = imgs.to(device), labels.to(device)
-                outputs = model(imgs)
-                loss = criterion(outputs, labels)
-                validation_loss += loss.item()
-                _, predicted = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-
-        average_validation_loss = validation_loss / len(validation_loader)
-        average_train_loss = train_loss / len(train_loader)
-        validation_accuracy = 100 * correct / total
-        scheduler.step(average_validation_loss)
-
-        writer.add_scalar('Loss/train_stage2', average_train_loss, epoch)
-        writer.add_scalar('Loss/validation_stage2', average_validation_loss, epoch)
-        writer.add_scalar('Accuracy/validation_stage2', validation_accuracy, epoch)
-
-        print(f'[STAGE 2] Epoch {epoch+1}/{stage2_epochs}: Train Loss: {average_train_loss:.4f}, Validation Loss: {average_validation_loss:.4f}, Validation Accuracy: {validation_accuracy:.2f}%')
-
-        if average_validation_loss < best_validation_loss:
-            best_validation_loss = average_validation_loss
-            torch.save(model.state_dict(), (MODELS_DIR / f'stage2_best.pth'))
-
-    writer.close()
\ No newline at end of file
+    scaler = make_grad_scaler(device, precision)
+    resume = resume_fit_kwargs(resume_state, 2, optimizer, scheduler, scaler, train_loader)
+    stage2_trainer = Trainer(prepare_training_model(model, device), criterion, device, precision=precision, channels_last=channels_last, callbacks=callbacks, batch_transform=batch_transform, accumulation_steps=accumulation_steps)
+    stage2_trainer.fit(train_loader, validation_loader, optimizer, scheduler, stage2_epochs, stage=2, scaler=scaler, **resume)
+
+    if is_main_process():
+        checkpoint_writer.close()
+        writer.close()
+    cleanup_distributed()
@@ -1,18 +1,68 @@
-import torch, time, optuna
+import argparse, shutil, torch, optuna
+import multiprocessing as mp
+from functools import partial
+from pathlib import Path
 import torch.optim as optim
-from src.model import get_model
-from src.dataloaderOptuna import split_dataset, get_dataloaders
+from src.dataloaderOptuna import split_dataset
+from src.trialcontext import get_trial_context, close_trial_contexts
 from torch.utils.tensorboard import SummaryWriter
+from src.features import get_feature_loaders
+from src.precision import resolve_precision, prepare_model
+from src.trainer import Callback, Trainer, ProgressPrinter, TensorBoardLogger, BestCheckpoint
+from src.compilation import compile_model, CompileCache
+from src.atomic import atomic_path
+from src.batchsize import find_max_batch_size, plan_batches
 from configs.paths import LOGS_DIR, MODELS_DIR
+from configs.training import PRECISION, CHANNELS_LAST, STAGE1_FEATURE_CACHE, STAGE1_AUGMENTATIONS, IMAGE_CACHE, IMAGE_CACHE_SIZE, AUGMENTATION_BACKEND, COMPILE, COMPILE_BACKEND, COMPILE_MODE, AUTO_BATCH_SIZE
+
+STAGE1_MAX_EPOCHS = 15
+STAGE2_MAX_EPOCHS = 30
+
+class OptunaPruning(Callback):
+    def __init__(self, trial):
+        self.trial = trial
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        # Stage 2 always starts at the same step, so trials with a shorter stage 1 are not compared
+        # against the head-only accuracy of trials that are still in stage 1.
+        step = epoch if stage == 1 else STAGE1_MAX_EPOCHS + epoch
+        self.trial.report(metrics['validation_accuracy'], step)
+        if self.trial.should_prune():
+            raise optuna.TrialPruned(f'Pruned at stage {stage} epoch {epoch + 1}')
+
+class FidelitySchedule(Callback):
+    def __init__(self, max_resource, image_size=224, min_image_size=224, min_fraction=1.0):
+        self.max_resource = max_resource
+        self.image_size = image_size
+        self.min_image_size = min_image_size
+        self.min_fraction = min_fraction
+        self.step = 0
+
+    def on_epoch_start(self, trainer, stage, epoch, epochs):
+        progress = self.step / max(self.max_resource - 1, 1)
+        image_size = self.min_image_size + progress * (self.image_size - self.min_image_size)
+        trainer.input_size = min(self.image_size, 32 * round(image_size / 32))
+        trainer.data_fraction = self.min_fraction + progress * (1 - self.min_fraction)
+        self.step += 1
+
+def build_optimizer(optimizer_name, params, lr, weight_decay):
+    if optimizer_name == 'AdamW':
+        return optim.AdamW(params, lr=lr, weight_decay=weight_decay)
+    elif optimizer_name == 'RMSprop':
+        return optim.RMSprop(params, lr=lr, weight_decay=weight_decay)
+    raise ValueError(f'Unknown optimizer {optimizer_name!r}')
 
-def objective(trial):
+def objective(trial, multi_fidelity=False, min_image_size=224, min_fraction=1.0):
     batch_size = trial.suggest_categorical('batch_size', [16, 32, 64])
     lr_stage1 = trial.suggest_float('lr_stage1', 0.0001, 0.01, log=True)
     lr_stage2 = trial.suggest_float('lr_stage2', 0.000001, 0.001, log=True)
     weight_decay = trial.suggest_float('weight_decay', 0.000001, 0.01, log=True)
     optimizer_name = trial.suggest_categorical('optimizer', ['AdamW', 'RMSprop'])
-    stage1_epochs = trial.suggest_int('stage1_epochs', 5, 15)
-    stage2_epochs = trial.suggest_int('stage2_epochs', 10, 30)
+    if multi_fidelity:
+        stage1_epochs, stage2_epochs = STAGE1_MAX_EPOCHS, STAGE2_MAX_EPOCHS
+    else:
+        stage1_epochs = trial.suggest_int('stage1_epochs', 5, 15)
+        stage2_epochs = trial.suggest_int('stage2_epochs', 10, 30)
     rotation_limit = trial.suggest_int('rotate_limit', 10, 45)
     shift_limit = trial.suggest_float('shift_limit', 0.01, 1)
     scale_limit = trial.suggest_float('scale_limit', 0.05, 0.15)
@@ -22,9 +72,16 @@ def objective(trial):
     hue = trial.suggest_float('hue', 0.1, 0.5)
 
     device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
-    model = get_model(model_name='mobilenetv4_hybrid_medium.e500_r224_in1k', num_classes=6, pretrained=True).to(device)
-
-    train_loader, validation_loader, _ = get_dataloaders(
+    precision = resolve_precision(PRECISION, device)
+    channels_last = CHANNELS_LAST
+    context = get_trial_context(use_cache=IMAGE_CACHE, cache_size=IMAGE_CACHE_SIZE, augmentation_backend=AUGMENTATION_BACKEND)
+    model_name = 'mobilenetv4_hybrid_medium.e500_r224_in1k'
+    model = prepare_model(context.create_model(model_name, num_classes=6), device, channels_last)
+    accumulation_steps = 1
+    if AUTO_BATCH_SIZE:
+        batch_size, accumulation_steps = plan_batches(batch_size, find_max_batch_size(model, device, model_name, precision=precision, channels_last=channels_last))
+
+    train_loader, validation_loader = context.get_dataloaders(
         batch_size=batch_size,
         rotation_limit=rotation_limit,
         shift_limit=shift_limit,
@@ -34,132 +91,130 @@ def objective(trial):
         saturation=saturation,
         hue=hue
     )
-    writer = SummaryWriter(LOGS_DIR)
+    trial_name = f'trial_{trial.number:04d}'
+    checkpoint_dir = MODELS_DIR / 'optuna' / trial.study.study_name / trial_name
+    trial.set_user_attr('checkpoint_dir', str(checkpoint_dir))
+    writer = SummaryWriter(LOGS_DIR / 'optuna' / trial.study.study_name / trial_name)
 
     criterion = torch.nn.CrossEntropyLoss()
-    best_validation_loss = float('inf')
+    callbacks = [TensorBoardLogger(writer), ProgressPrinter(), BestCheckpoint(model, checkpoint_dir), OptunaPruning(trial)]
+    compiled_model = model
+    if COMPILE:
+        compiled_model = compile_model(model, backend=COMPILE_BACKEND, mode=COMPILE_MODE, cache_name='mobilenetv4-train', device=device)
+        callbacks.append(CompileCache('mobilenetv4-train', device))
+    if multi_fidelity:
+        callbacks.insert(0, FidelitySchedule(stage1_epochs + stage2_epochs, min_image_size=min_image_size, min_fraction=min_fraction))
+
+    try:
+        if STAGE1_FEATURE_CACHE:
+            stage1_train_loader, stage1_validation_loader = get_feature_loaders(
+                model,
+                train_loader.dataset,
+                validation_loader.dataset,
+                device,
+                augmentations=STAGE1_AUGMENTATIONS,
+                batch_size=batch_size,
+                precision=precision,
+                batch_transform=context.batch_transform
+            )
+            stage1_trainer = Trainer(model.get_classifier(), criterion, device, precision=precision, callbacks=callbacks, accumulation_steps=accumulation_steps)
+        else:
+            stage1_train_loader, stage1_validation_loader = train_loader, validation_loader
+            stage1_trainer = Trainer(compiled_model, criterion, device, precision=precision, channels_last=channels_last, callbacks=callbacks, batch_transform=context.batch_transform, accumulation_steps=accumulation_steps)
+
+        for param in model.parameters():
+            param.requires_grad = False
+        for param in model.get_classifier().parameters():
+            param.requires_grad = True
+
+        optimizer = build_optimizer(optimizer_name, filter(lambda p: p.requires_grad, model.parameters()), lr_stage1, weight_decay)
+        scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
+        stage1_trainer.fit(stage1_train_loader, stage1_validation_loader, optimizer, scheduler, stage1_epochs, stage=1)
+
+        for param in model.parameters():
+            param.requires_grad = True
+
+        optimizer = build_optimizer(optimizer_name, model.parameters(), lr_stage2, weight_decay)
+        scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
+        stage2_trainer = Trainer(compiled_model, criterion, device, precision=precision, channels_last=channels_last, callbacks=callbacks, batch_transform=context.batch_transform, accumulation_steps=accumulation_steps)
+        metrics = stage2_trainer.fit(train_loader, validation_loader, optimizer, scheduler, stage2_epochs, stage=2)
+    finally:
+        writer.close()
+
+    return metrics['validation_accuracy']
+
+def promote_best_trial(study, destination=(MODELS_DIR / 'stage2_best.pth')):
+    if not study.get_trials(deepcopy=False, states=(optuna.trial.TrialState.COMPLETE,)):
+        return None
+    checkpoint_dir = Path(study.best_trial.user_attrs['checkpoint_dir'])
+    checkpoint = checkpoint_dir / 'stage2_best.pth'
+    if not checkpoint.exists():
+        checkpoint = checkpoint_dir / 'stage1_best.pth'
+
+    with atomic_path(destination) as tmp_path:
+        shutil.copyfile(checkpoint, tmp_path)
+    return checkpoint
+
+def make_pruner(pruner):
+    if pruner == 'hyperband':
+        return optuna.pruners.HyperbandPruner(min_resource=1, max_resource=STAGE1_MAX_EPOCHS + STAGE2_MAX_EPOCHS, reduction_factor=3)
+    return optuna.pruners.MedianPruner(n_warmup_steps=2)
+
+def get_storage(storage):
+    if storage.startswith(('sqlite:', 'postgresql:', 'mysql:')):
+        return storage
+    return optuna.storages.JournalStorage(optuna.storages.journal.JournalFileBackend(storage, lock_obj=optuna.storages.journal.JournalFileOpenLock(storage)))
+
+def run_worker(storage, study_name, n_trials, n_jobs, pruner, trial_objective):
+    study = optuna.load_study(study_name=study_name, storage=get_storage(storage), pruner=make_pruner(pruner))
+    try:
+        study.optimize(trial_objective, n_trials=n_trials, n_jobs=n_jobs)
+    finally:
+        close_trial_contexts()
 
-    for param in model.parameters():
-        param.requires_grad = False
-    for param in model.get_classifier().parameters():
-        param.requires_grad = True
-
-    if optimizer_name == 'AdamW':
-        optimizer = optim.AdamW(filter(lambda p: p.requires_grad, model.parameters()), lr=lr_stage1, weight_decay=weight_decay)
-    elif optimizer_name == 'RMSprop':
-        optimizer = optim.RMSprop(filter(lambda p: p.requires_grad, model.parameters()), lr=lr_stage1, weight_decay=weight_decay)
-
-    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
-
-    for epoch in range(stage1_epochs):
-        model.train()
-        train_loss = 0.0
-
-        for imgs, labels in train_loader:
-            start = time.time()
-            imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            train_loss += loss.item()
-
-        model.eval()
-        validation_loss = 0.0
-        correct = 0
-        total = 0
-
-        with torch.no_grad():
-            for imgs, labels in validation_loader:
-                imgs, labels = imgs.to(device), labels.to(device)
-                outputs = model(imgs)
-                loss = criterion(outputs, labels)
-                validation_loss += loss.item()
-                _, predicted = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-
-        average_validation_loss = validation_loss / len(validation_loader)
-        average_train_loss = train_loss / len(train_loader)
-        validation_accuracy = 100 * correct / total
-        scheduler.step(average_validation_loss)
-
-        writer.add_scalar('Loss/train_stage1', average_train_loss, epoch)
-        writer.add_scalar('Loss/validation_stage1', average_validation_loss, epoch)
-        writer.add_scalar('Accuracy/validation_stage1', validation_accuracy, epoch)
-
-        print(f'[STAGE 1] Epoch {epoch+1}/{stage1_epochs}: Train Loss: {average_train_loss:.4f}, Validation Loss: {average_validation_loss:.4f}, Validation Accuracy: {validation_accuracy:.2f}%')
-
-        if average_validation_loss < best_validation_loss:
-            best_validation_loss = average_validation_loss
-            torch.save(model.state_dict(), (MODELS_DIR / f'stage1_best.pth'))
-
-    for param in model.parameters():
-        param.requires_grad = True
-
-    if optimizer_name == 'AdamW':
-        optimizer = optim.AdamW(model.parameters(), lr=lr_stage2, weight_decay=weight_decay)
-    elif optimizer_name == 'RMSprop':
-        optimizer = optim.RMSprop(model.parameters(), lr=lr_stage2, weight_decay=weight_decay)
-
-    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=3)
-
-    for epoch in range(stage2_epochs):
-        model.train()
-        train_loss = 0.0
-
-        for imgs, labels in train_loader:
-            imgs, labels = imgs.to(device), labels.to(device)
-            optimizer.zero_grad()
-            outputs = model(imgs)
-            loss = criterion(outputs, labels)
-            loss.backward()
-            optimizer.step()
-            train_loss += loss.item()
-
-        model.eval()
-        validation_loss = 0.0
-        correct = 0
-        total = 0
-
-        with torch.no_grad():
-            for imgs, labels in validation_loader:
-                imgs, labels = imgs.to(device), labels.to(device)
-                outputs = model(imgs)
-                loss = criterion(outputs, labels)
-                validation_loss += loss.item()
-                _, predicted = torch.max(outputs, 1)
-                total += labels.size(0)
-                correct += (predicted == labels).sum().item()
-
-        average_validation_loss = validation_loss / len(validation_loader)
-        average_train_loss = train_loss / len(train_loader)
-        validation_accuracy = 100 * correct / total
-        scheduler.step(average_validation_loss)
-
-        writer.add_scalar('Loss/train_stage2', average_train_loss, epoch)
-        writer.add_scalar('Loss/validation_stage2', average_validation_loss, epoch)
-        writer.add_scalar('Accuracy/validation_stage2', validation_accuracy, epoch)
-
-        print(f'[STAGE 2] Epoch {epoch+1}/{stage2_epochs}: Train Loss: {average_train_loss:.4f}, Validation Loss: {average_validation_loss:.4f}, Validation Accuracy: {validation_accuracy:.2f}%')
-
-        if average_validation_loss < best_validation_loss:
-            best_validation_loss = average_validation_loss
-            torch.save(model.state_dict(), (MODELS_DIR / f'stage2_best.pth'))
-
-    writer.close()
-
-    return validation_accuracy
-    
 if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Search training hyperparameters with Optuna.')
+    parser.add_argument('--n-trials', type=int, default=3, help='Total number of trials to run')
+    parser.add_argument('--n-jobs', type=int, default=1, help='Parallel trials (threads) per worker process')
+    parser.add_argument('--workers', type=int, default=1, help='Worker processes sharing the study storage')
+    parser.add_argument('--storage', default=str(LOGS_DIR / 'optuna_journal.log'), help='Journal file path or database URL (e.g. sqlite:///logs/optuna.db)')
+    parser.add_argument('--study-name', default='waste-classification')
+    parser.add_argument('--pruner', choices=['median', 'hyperband'], default='median', help='hyperband trains every trial for the maximum epochs and lets successive halving stop them early')
+    parser.add_argument('--min-image-size', type=int, default=224, help='With hyperband, training resolution of the first epoch, growing to 224 by the last')
+    parser.add_argument('--min-fraction', type=float, default=1.0, help='With hyperband, fraction of the training set used in the first epoch, growing to 1.0 by the last')
+    args = parser.parse_args()
+
+    trial_objective = partial(objective, multi_fidelity=(args.pruner == 'hyperband'), min_image_size=args.min_image_size, min_fraction=args.min_fraction)
+
     split_dataset()
 
-    study = optuna.create_study(direction='maximize', pruner=optuna.pruners.MedianPruner())
-    study.optimize(objective, n_trials=3)
+    study = optuna.create_study(
+        study_name=args.study_name,
+        storage=get_storage(args.storage),
+        direction='maximize',
+        pruner=make_pruner(args.pruner),
+        load_if_exists=True
+    )
 
-    print('Best trial:')
-    print('Value: ', study.best_trial.value)
-    print('Params: ')
-    for key, value in study.best_trial.params.items():
-        print(f'{key}: {value}')
\ No newline at end of file
+    trials_per_worker = [args.n_trials // args.workers + (i < args.n_trials % args.workers) for i in range(args.workers)]
+    context = mp.get_context('spawn')
+    processes = [context.Process(target=run_worker, args=(args.storage, args.study_name, n_trials, args.n_jobs, args.pruner, trial_objective)) for n_trials in trials_per_worker[1:] if n_trials]
+    for process in processes:
+        process.start()
+    try:
+        study.optimize(trial_objective, n_trials=trials_per_worker[0], n_jobs=args.n_jobs)
+    finally:
+        close_trial_contexts()
+    for process in processes:
+        process.join()
+
+    checkpoint = promote_best_trial(study)
+    if checkpoint is None:
+        print(f'No trial of study {args.study_name!r} has completed, nothing to promote')
+    else:
+        print('Best trial:')
+        print('Value: ', study.best_trial.value)
+        print('Params: ')
+        for key, value in study.best_trial.params.items():
+            print(f'{key}: {value}')
+        print(f'Promoted {checkpoint} to {MODELS_DIR / "stage2_best.pth"}')
@@ -0,0 +1,172 @@
+import math, torch
+import torch.nn.functional as F
+from contextlib import nullcontext
+from itertools import islice
+from src.precision import autocast, make_grad_scaler, to_device
+from src.distributed import all_reduce_sum
+from src.atomic import atomic_write
+
+def save_checkpoint(obj, path):
+    with atomic_write(path, 'wb') as f:
+        torch.save(obj, f)
+
+class Callback:
+    def on_epoch_start(self, trainer, stage, epoch, epochs):
+        pass
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        pass
+
+    def on_batch_end(self, trainer, batch):
+        pass
+
+class ProgressPrinter(Callback):
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        print(f'[STAGE {stage}] Epoch {epoch+1}/{epochs}: Train Loss: {metrics["train_loss"]:.4f}, Validation Loss: {metrics["validation_loss"]:.4f}, Validation Accuracy: {metrics["validation_accuracy"]:.2f}%')
+
+class TensorBoardLogger(Callback):
+    def __init__(self, writer):
+        self.writer = writer
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        self.writer.add_scalar(f'Loss/train_stage{stage}', metrics['train_loss'], epoch)
+        self.writer.add_scalar(f'Loss/validation_stage{stage}', metrics['validation_loss'], epoch)
+        self.writer.add_scalar(f'Accuracy/validation_stage{stage}', metrics['validation_accuracy'], epoch)
+
+class BestCheckpoint(Callback):
+    def __init__(self, model, directory):
+        self.model = model
+        self.directory = directory
+        self.best_validation_loss = float('inf')
+
+    def on_epoch_end(self, trainer, stage, epoch, epochs, metrics):
+        if metrics['validation_loss'] < self.best_validation_loss:
+            self.best_validation_loss = metrics['validation_loss']
+            save_checkpoint(self.model.state_dict(), (self.directory / f'stage{stage}_best.pth'))
+
+class Trainer:
+    def __init__(self, model, criterion, device, precision='fp32', channels_last=False, callbacks=None, batch_transform=None, accumulation_steps=1):
+        self.model = model
+        self.criterion = criterion
+        self.device = device
+        self.precision = precision
+        self.channels_last = channels_last
+        self.batch_transform = batch_transform
+        self.accumulation_steps = accumulation_steps
+        self.callbacks = callbacks or []
+        self.input_size = None
+        self.data_fraction = 1.0
+        self.stop = False
+        self.optimizer = None
+        self.scheduler = None
+        self.scaler = None
+        self.train_loader = None
+        self.stage = None
+        self.epoch = None
+        self.batches = 0
+        self.accumulated = 0
+        self.train_loss = None
+
+    def optimizer_step(self, optimizer, scaler):
+        # Losses are divided by accumulation_steps, so a shorter last group is scaled back up to its mean.
+        if self.accumulated < self.accumulation_steps:
+            for group in optimizer.param_groups:
+                for param in group['params']:
+                    if param.grad is not None:
+                        param.grad.mul_(self.accumulation_steps / self.accumulated)
+        scaler.step(optimizer)
+        scaler.update()
+        optimizer.zero_grad()
+
+    def train_epoch(self, train_loader, optimizer, scaler, start_batch=0, start_loss=0.0):
+        self.model.train()
+        train_loss = torch.full((), start_loss, device=self.device)
+        batches = start_batch
+
+        max_batches = None if self.data_fraction >= 1 else max(1, math.ceil(self.data_fraction * len(train_loader)))
+        iterator = iter(islice(train_loader, max_batches))
+        next_batch = next(iterator, None)
+        self.accumulated = 0
+        optimizer.zero_grad()
+        while next_batch is not None:
+            imgs, labels = next_batch
+            next_batch = next(iterator, None)
+            imgs, labels = to_device(imgs, self.device, self.channels_last), labels.to(self.device, non_blocking=True)
+            if self.batch_transform is not None:
+                imgs = to_device(self.batch_transform(imgs), self.device, self.channels_last)
+            if self.input_size is not None and imgs.dim() == 4 and imgs.shape[-1] != self.input_size:
+                imgs = F.interpolate(imgs, size=(self.input_size, self.input_size), mode='bilinear', antialias=True)
+            batches += 1
+            self.accumulated += 1
+            step = self.accumulated == self.accumulation_steps or next_batch is None
+            # DistributedDataParallel only needs to all-reduce the gradients of the micro-batch that steps.
+            no_sync = getattr(self.model, 'no_sync', None)
+            with nullcontext() if step or no_sync is None else no_sync():
+                with autocast(self.device, self.precision):
+                    outputs = self.model(imgs)
+                    loss = self.criterion(outputs, labels)
+                scaler.scale(loss / self.accumulation_steps).backward()
+            if step:
+                self.optimizer_step(optimizer, scaler)
+                self.accumulated = 0
+            train_loss += loss.detach().float()
+            self.batches, self.train_loss = batches, train_loss
+            for callback in self.callbacks:
+                callback.on_batch_end(self, batches)
+
+        totals = all_reduce_sum(torch.stack([train_loss, torch.tensor(float(batches), device=self.device)]))
+        return (totals[0] / totals[1].clamp(min=1)).item()
+
+    def validate(self, validation_loader):
+        self.model.eval()
+        validation_loss = torch.zeros((), device=self.device)
+        correct = torch.zeros((), dtype=torch.long, device=self.device)
+        total = 0
+        batches = 0
+
+        with torch.no_grad():
+            for imgs, labels in validation_loader:
+                imgs, labels = to_device(imgs, self.device, self.channels_last), labels.to(self.device, non_blocking=True)
+                with autocast(self.device, self.precision):
+                    outputs = self.model(imgs)
+                    loss = self.criterion(outputs, labels)
+                validation_loss += loss.float()
+                correct += (outputs.argmax(1) == labels).sum()
+                total += labels.size(0)
+                batches += 1
+
+        totals = all_reduce_sum(torch.stack([validation_loss, torch.tensor(float(batches), device=self.device), correct.float(), torch.tensor(float(total), device=self.device)]))
+        validation_loss, batches, correct, total = totals.tolist()
+        return validation_loss / max(batches, 1), 100 * correct / max(total, 1)
+
+    def fit(self, train_loader, validation_loader, optimizer, scheduler, epochs, stage, scaler=None, start_epoch=0, start_batch=0, start_loss=0.0):
+        if scaler is None:
+            scaler = make_grad_scaler(self.device, self.precision)
+        self.optimizer, self.scheduler, self.scaler = optimizer, scheduler, scaler
+        self.train_loader = train_loader
+        self.stage = stage
+        self.stop = False
+        metrics = {}
+
+        for epoch in range(start_epoch, epochs):
+            self.epoch = epoch
+            self.batches = 0
+            sampler = getattr(train_loader, 'sampler', None)
+            if hasattr(sampler, 'set_epoch'):
+                sampler.set_epoch(epoch)
+            for callback in self.callbacks:
+                callback.on_epoch_start(self, stage, epoch, epochs)
+            if epoch == start_epoch and start_batch:
+                train_loss = self.train_epoch(train_loader, optimizer, scaler, start_batch, start_loss)
+            else:
+                train_loss = self.train_epoch(train_loader, optimizer, scaler)
+            validation_loss, validation_accuracy = self.validate(validation_loader)
+            metrics = {'train_loss': train_loss, 'validation_loss': validation_loss, 'validation_accuracy': validation_accuracy}
+            scheduler.step(validation_loss)
+
+            for callback in self.callbacks:
+                callback.on_epoch_end(self, stage, epoch, epochs, metrics)
+            if self.stop:
+                break
+
+        return metrics
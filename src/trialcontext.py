@@ -0,0 +1,82 @@
+import atexit, threading
+from src.model import get_model, build_model_from_state_dict
+from src.dataloaderOptuna import get_dataloaders, SharedAugmentation
+from src.batchaugment import BatchAugmentation
+
+_pretrained_state_dicts = {}
+_pretrained_lock = threading.Lock()
+_contexts = []
+_contexts_lock = threading.Lock()
+_local = threading.local()
+
+def pretrained_state_dict(model_name, num_classes=6):
+    with _pretrained_lock:
+        key = (model_name, num_classes)
+        if key not in _pretrained_state_dicts:
+            model = get_model(model_name=model_name, num_classes=num_classes, pretrained=True)
+            _pretrained_state_dicts[key] = {name: tensor.detach().clone() for name, tensor in model.state_dict().items()}
+        return _pretrained_state_dicts[key]
+
+def shutdown_workers(loader):
+    iterator = getattr(loader, '_iterator', None)
+    if iterator is not None:
+        iterator._shutdown_workers()
+        loader._iterator = None
+
+class TrialContext:
+    def __init__(self, use_cache=False, cache_size=None, augmentation_backend='albumentations'):
+        self.use_cache = use_cache
+        self.cache_size = cache_size
+        self.augmentation_backend = augmentation_backend
+        self.augmentation = None
+        self.batch_transform = None
+        self.train_loader = None
+        self.validation_loader = None
+
+    def create_model(self, model_name, num_classes=6):
+        state_dict = {name: tensor.clone() for name, tensor in pretrained_state_dict(model_name, num_classes).items()}
+        model = build_model_from_state_dict(state_dict, model_name=model_name, num_classes=num_classes)
+        model.reset_classifier(num_classes)
+        return model
+
+    def get_dataloaders(self, batch_size, **augmentation):
+        if self.train_loader is None:
+            self.augmentation = SharedAugmentation(**augmentation)
+            self.train_loader, self.validation_loader, _ = get_dataloaders(
+                batch_size=batch_size,
+                use_cache=self.use_cache,
+                cache_size=self.cache_size,
+                augmentation=self.augmentation,
+                augmentation_backend=self.augmentation_backend,
+                **augmentation
+            )
+        else:
+            self.augmentation.update(**augmentation)
+            self.train_loader.batch_sampler.batch_size = batch_size
+            self.validation_loader.batch_sampler.batch_size = batch_size
+        if self.augmentation_backend == 'batch':
+            self.batch_transform = BatchAugmentation(**augmentation)
+        return self.train_loader, self.validation_loader
+
+    def close(self):
+        for loader in (self.train_loader, self.validation_loader):
+            if loader is not None:
+                shutdown_workers(loader)
+        self.train_loader = None
+        self.validation_loader = None
+
+def get_trial_context(use_cache=False, cache_size=None, augmentation_backend='albumentations'):
+    context = getattr(_local, 'context', None)
+    if context is None:
+        context = TrialContext(use_cache=use_cache, cache_size=cache_size, augmentation_backend=augmentation_backend)
+        _local.context = context
+        with _contexts_lock:
+            _contexts.append(context)
+    return context
+
+def close_trial_contexts():
+    with _contexts_lock:
+        for context in _contexts:
+            context.close()
+
+atexit.register(close_trial_contexts)
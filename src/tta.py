@@ -0,0 +1,43 @@
+import torch
+import torch.nn.functional as F
+
+def zoom_in(imgs, scale=1.15):
+    size = imgs.shape[-1]
+    crop = round(size / scale)
+    offset = (size - crop) // 2
+    cropped = imgs[..., offset:offset + crop, offset:offset + crop]
+    return F.interpolate(cropped, size=(size, size), mode='bilinear', align_corners=False)
+
+def zoom_out(imgs, scale=1.15):
+    size = imgs.shape[-1]
+    shrunk = round(size / scale)
+    resized = F.interpolate(imgs, size=(shrunk, shrunk), mode='bilinear', align_corners=False, antialias=True)
+    before = (size - shrunk) // 2
+    after = size - shrunk - before
+    return F.pad(resized, (before, after, before, after), mode='reflect')
+
+TTA_VIEWS = {
+    'identity': lambda imgs: imgs,
+    'hflip': lambda imgs: imgs.flip(-1),
+    'vflip': lambda imgs: imgs.flip(-2),
+    'rot90': lambda imgs: imgs.rot90(1, dims=(-2, -1)),
+    'rot270': lambda imgs: imgs.rot90(3, dims=(-2, -1)),
+    'rot180': lambda imgs: imgs.rot90(2, dims=(-2, -1)),
+    'zoom_in': zoom_in,
+    'zoom_out': zoom_out
+}
+MAX_TTA_VIEWS = len(TTA_VIEWS)
+
+def tta_views(num_views):
+    if not 1 <= num_views <= MAX_TTA_VIEWS:
+        raise ValueError(f'TTA supports 1 to {MAX_TTA_VIEWS} views, got {num_views}')
+    return list(TTA_VIEWS)[:num_views]
+
+def stack_views(imgs, num_views):
+    return torch.stack([TTA_VIEWS[view](imgs) for view in tta_views(num_views)], 1).flatten(0, 1)
+
+def predict_tta(model, imgs, num_views=1):
+    if num_views == 1:
+        return torch.softmax(model(imgs), dim=1)
+    outputs = model(stack_views(imgs, num_views))
+    return torch.softmax(outputs.float(), dim=1).view(imgs.shape[0], num_views, -1).mean(1)